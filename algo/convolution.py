@@ -0,0 +1,50 @@
+import numpy as np
+from scipy.signal import fftconvolve
+
+# Below this many multiply-adds a direct convolution beats the FFT.
+DIRECT_CONVOLUTION_LIMIT = 1 << 20
+
+
+def clipped_convolve(signal, kernel, length):
+    """
+    Convolution of signal and kernel truncated to length bins, where all mass past the last bin is folded into it.
+    Mirrors the latency_pdf[min(latency + shift, inf)] += ... accumulation of the projection loops.
+    """
+    if len(signal) * len(kernel) <= DIRECT_CONVOLUTION_LIMIT:
+        full = np.convolve(signal, kernel)
+    else:
+        full = np.maximum(fftconvolve(signal, kernel), 0)
+    out = np.zeros(length)
+    head = min(length, len(full))
+    out[:head] = full[:head]
+    out[-1] += full[length:].sum()
+    return out
+
+
+def box_filter(signal, width):
+    """
+    Sum of signal shifted by 0..width-1 bins, with mass shifted past the last bin folded into it.
+    Computed by cumulative-sum differencing in O(len(signal)) regardless of width.
+    """
+    window_sums = np.cumsum(signal)
+    window_sums[width:] -= window_sums[:-width].copy()
+    window_sums[-1] = width * signal.sum() - window_sums[:-1].sum()
+    return window_sums
+
+
+def box_aggregate(positions, weights, widths, length):
+    """
+    Add weights[i] on every bin of [positions[i], positions[i] + widths[i]), mass falling past the last bin being
+    folded into it. Vectorized form of the
+    for phi in range(width): pdf[min(position + phi, length - 1)] += weight
+    loops of the coverage engines, by a difference array and one cumulative sum.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    ends = positions + np.asarray(widths, dtype=np.int64)
+    last = length - 1
+    deltas = np.bincount(np.minimum(positions, last), weights=weights, minlength=length + 1) - \
+        np.bincount(np.minimum(ends, last), weights=weights, minlength=length + 1)
+    out = np.cumsum(deltas[:length])
+    out[-1] = (weights * (ends - np.maximum(positions, last)).clip(0, None)).sum()
+    return out
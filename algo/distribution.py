@@ -0,0 +1,155 @@
+import numpy as np
+from scipy.special import bernoulli, comb
+
+
+def _power_sum(k, n):
+    """Sum of x ** k for x in [0, n), elementwise over n, by Faulhaber's formula."""
+    n = np.asarray(n, dtype=np.float64)
+    bernoulli_numbers = bernoulli(k)
+    return sum(comb(k + 1, i) * bernoulli_numbers[i] * n ** (k + 1 - i) for i in range(k + 1)) / (k + 1)
+
+
+class LatencyDistribution:
+    """
+    Latency distribution over integer milliseconds stored as run-length encoded support.
+    Run i spreads values[i] on every latency in [starts[i], starts[i] + lengths[i]); runs are sorted, disjoint and
+    latencies outside them have zero probability. All latencies from horizon on are lumped into tail_mass, which the
+    queries place at horizon, so a distribution built from an engine pdf answers exactly as the dense cumsum does.
+    Memory grows with the number of runs, not with the horizon.
+    """
+    def __init__(self, starts, lengths, values, tail_mass, horizon, dtype=np.float64):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.values = np.asarray(values, dtype=dtype)
+        self.tail_mass = float(tail_mass)
+        self.horizon = int(horizon)
+        if not (len(self.starts) == len(self.lengths) == len(self.values)):
+            raise ValueError("Runs must have as many starts, lengths and values.")
+        if np.any(self.lengths <= 0) or np.any(self.starts[1:] < self.starts[:-1] + self.lengths[:-1]):
+            raise ValueError("Runs must be non-empty, sorted and disjoint.")
+        if len(self.starts) > 0 and (self.starts[0] < 0 or self.starts[-1] + self.lengths[-1] > self.horizon):
+            raise ValueError("Runs must lie in [0, horizon).")
+        # Mass up to the end of every run, kept in float64 whatever the storage dtype
+        self.run_cum_mass = np.cumsum(self.values.astype(np.float64) * self.lengths)
+
+    @staticmethod
+    def from_dense(pdf, horizon=None, dtype=np.float64):
+        """
+        From an engine pdf. pdf[horizon:] is lumped into the tail; by default horizon is the last bin, which holds
+        the timeouts (BruteForceLossAdvdelaySimulator) or the clipped latencies (coverage engines).
+        """
+        pdf = np.asarray(pdf, dtype=np.float64)
+        horizon = len(pdf) - 1 if horizon is None else horizon
+        finite = pdf[:horizon]
+        change = np.flatnonzero(np.diff(finite)) + 1
+        starts = np.concatenate(([0], change)) if len(finite) > 0 else np.zeros(0, dtype=np.int64)
+        lengths = np.diff(np.append(starts, len(finite)))
+        values = finite[starts]
+        nonzero = values != 0
+        return LatencyDistribution(starts[nonzero], lengths[nonzero], values[nonzero], pdf[horizon:].sum(), horizon,
+                                   dtype)
+
+    @staticmethod
+    def from_samples(latencies, horizon, dtype=np.float64):
+        """Empirical distribution of sampled latencies; latencies at or beyond horizon count as the tail."""
+        latencies = np.asarray(latencies)
+        if len(latencies) == 0:
+            raise ValueError("At least one latency must be provided.")
+        support, counts = np.unique(latencies[latencies < horizon], return_counts=True)
+        return LatencyDistribution(support, np.ones(len(support), dtype=np.int64), counts / len(latencies),
+                                   np.count_nonzero(latencies >= horizon) / len(latencies), horizon, dtype)
+
+    @staticmethod
+    def from_boxes(starts, widths, weights, horizon, dtype=np.float64):
+        """
+        Normalized sum of boxes, box i spreading weights[i] on every latency in [starts[i], starts[i] + widths[i]).
+        This is the Range-Entrance Projection of the coverage engines: every base latency repeated over the advertising
+        phases. Latencies at or beyond horizon are lumped into the tail.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        widths = np.broadcast_to(np.asarray(widths, dtype=np.int64), starts.shape)
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), starts.shape)
+        total = (weights * widths).sum()
+        if total <= 0:
+            raise ValueError("Boxes must carry a positive mass.")
+        ends = starts + widths
+        tail_mass = (weights * (ends - np.clip(np.maximum(starts, horizon), None, ends))).sum()
+        # Value on each segment between consecutive breakpoints is the running sum of the box edges
+        breakpoints = np.concatenate((np.minimum(starts, horizon), np.minimum(ends, horizon)))
+        deltas = np.concatenate((weights, -weights))
+        order = np.argsort(breakpoints, kind='stable')
+        breakpoints, deltas = breakpoints[order], deltas[order]
+        segment_starts, first = np.unique(breakpoints, return_index=True)
+        segment_values = np.cumsum(deltas)[np.append(first[1:], len(deltas)) - 1]
+        segment_lengths = np.diff(np.append(segment_starts, horizon))
+        keep = (segment_lengths > 0) & (np.abs(segment_values) > 1e-15 * np.abs(weights).max())
+        return LatencyDistribution(segment_starts[keep], segment_lengths[keep], segment_values[keep] / total,
+                                   tail_mass / total, horizon, dtype)
+
+    @property
+    def finite_mass(self):
+        return float(self.run_cum_mass[-1]) if len(self.run_cum_mass) > 0 else 0.0
+
+    @property
+    def total_mass(self):
+        return self.finite_mass + self.tail_mass
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.lengths.nbytes + self.values.nbytes + self.run_cum_mass.nbytes
+
+    def pmf(self, latency):
+        latency = np.asarray(latency)
+        return self.cdf(latency) - self.cdf(latency - 1)
+
+    def cdf(self, latency):
+        """P(latency <= t) for every t in latency, the tail counting from horizon on."""
+        latency = np.asarray(latency)
+        result = np.zeros(latency.shape)
+        if len(self.starts) > 0:
+            run_idx = np.searchsorted(self.starts, latency, side='right') - 1
+            safe_idx = run_idx.clip(0, None)
+            before = np.where(safe_idx > 0, self.run_cum_mass[safe_idx - 1], 0.0)
+            covered = np.minimum(latency - self.starts[safe_idx] + 1, self.lengths[safe_idx])
+            result = np.where(run_idx >= 0, before + self.values[safe_idx] * covered, 0.0)
+        return np.where(latency >= self.horizon, result + self.tail_mass, result)
+
+    def quantile(self, prob):
+        """Smallest latency whose CDF reaches prob; horizon when only the tail reaches it."""
+        prob = np.asarray(prob, dtype=np.float64)
+        if len(self.starts) == 0:
+            return np.full(prob.shape, self.horizon, dtype=np.int64)
+        run_idx = np.searchsorted(self.run_cum_mass, prob, side='left')
+        safe_idx = run_idx.clip(None, len(self.starts) - 1)
+        before = np.where(safe_idx > 0, self.run_cum_mass[safe_idx - 1], 0.0)
+        offset = np.ceil((prob - before) / self.values[safe_idx]).clip(1, None).astype(np.int64) - 1
+        latency = self.starts[safe_idx] + np.minimum(offset, self.lengths[safe_idx] - 1)
+        return np.where(run_idx < len(self.starts), latency, self.horizon)
+
+    def moment(self, k=1):
+        """k-th raw moment of the latency conditioned on it falling before horizon, i.e. on discovery."""
+        if self.finite_mass <= 0:
+            return float('nan')
+        power_sums = sum(comb(k, j) * self.starts.astype(np.float64) ** (k - j) * _power_sum(j, self.lengths)
+                         for j in range(k + 1))
+        return float((self.values * power_sums).sum() / self.finite_mass)
+
+    def mean(self):
+        return self.moment(1)
+
+    def std(self):
+        mean = self.mean()
+        return float(np.sqrt(max(self.moment(2) - mean ** 2, 0)))
+
+    def to_dense(self):
+        """The pdf of length horizon + 1 the engines return, the tail in the last bin."""
+        pdf = np.zeros(self.horizon + 1)
+        deltas = np.zeros(self.horizon + 2)
+        np.add.at(deltas, self.starts, self.values)
+        np.add.at(deltas, self.starts + self.lengths, -self.values.astype(np.float64))
+        pdf[:-1] = np.cumsum(deltas)[:self.horizon]
+        pdf[-1] = self.tail_mass
+        return pdf
+
+    def to_cdf(self):
+        return np.cumsum(self.to_dense())
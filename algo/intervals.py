@@ -1,6 +1,8 @@
 import bisect
 from typing import Tuple, List
 
+import numpy as np
+
 
 class Intervals:
     def __init__(self, limit: Tuple[int, int]):
@@ -67,6 +69,66 @@ class Intervals:
         return 1 - self.coverage
 
 
+class SortedIntervals:
+    """
+    Drop-in replacement of Intervals keeping the covered fragments as two sorted lists of starts and ends.
+    Fragments overlapping a query are located by bisection and merged in place by a single slice assignment, so a
+    query or an insert costs O(log n) comparisons plus the fragments it touches, instead of a full scan and rebuild.
+    Unlike Intervals, fragments lying strictly inside a query whose ends both fall in gaps are subtracted as well.
+    """
+    def __init__(self, limit: Tuple[int, int]):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.limit: Tuple[int, int] = limit
+        self.coverage = 0.0
+        self.int_coverage = 0
+        self.length = limit[1] - limit[0]
+
+    @property
+    def interval_sorted(self):
+        return list(zip(self.starts, self.ends))
+
+    def insert(self, interval: Tuple[int, int]):
+        if interval[0] < self.limit[0] or interval[1] > self.limit[1]:
+            raise ValueError(
+                f"Interval [{interval[0]}, {interval[1]}) exceeds the interval limit [{self.limit[0]}, {self.limit[1]}).")
+        # Fragments touching or overlapping the interval merge with it
+        i = bisect.bisect_left(self.ends, interval[0])
+        j = bisect.bisect_right(self.starts, interval[1])
+        start, end = interval
+        if i < j:
+            start, end = min(start, self.starts[i]), max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def overlap(self, interval: Tuple[int, int]):
+        """Length of the interval already covered."""
+        i = bisect.bisect_right(self.ends, interval[0])
+        j = bisect.bisect_left(self.starts, interval[1])
+        return sum(min(self.ends[k], interval[1]) - max(self.starts[k], interval[0]) for k in range(i, j))
+
+    def get_new_coverage_all(self, interval_list: List[Tuple[int, int]]):
+        coverage_int, coverage_ratio = 0, 0.0
+        for i in interval_list:
+            ci, cr = self.get_new_coverage(i, do_insert_after=True)
+            coverage_int, coverage_ratio = coverage_int + ci, coverage_ratio + cr
+        return coverage_int, coverage_ratio
+
+    def get_new_coverage(self, interval: Tuple[int, int], do_insert_after=False):
+        coverage_int = max(0, interval[1] - interval[0] - self.overlap(interval))
+        if do_insert_after:
+            self.insert(interval)
+        coverage_ratio = coverage_int / (self.limit[1] - self.limit[0])
+        self.coverage += coverage_ratio
+        self.int_coverage += coverage_int
+        return coverage_int, coverage_ratio
+
+    def get_remain(self, use_int=False):
+        if use_int:
+            return self.length - self.int_coverage
+        return 1 - self.coverage
+
+
 class ProbabilityIntervals:
     def __init__(self, limit: Tuple[int, int]):
         self.interval_sorted: List[Tuple[int, int, float]] = [(limit[0], limit[0], 0.0), (limit[1], limit[1], 0.0)]
@@ -179,6 +241,54 @@ class ProbabilityIntervals:
         return 1 - self.coverage
 
 
+class ProbabilityVector:
+    """
+    Drop-in replacement of ProbabilityIntervals on an integer grid: miss_prob[i] is the probability that position
+    limit[0] + i is still undiscovered. Covering [a, b) with loss ratio q discovers (1 - q) * sum(miss_prob[a:b]) and
+    multiplies the slice by q, in O(b - a) vectorized work whatever the coverage history.
+    The loss ratio of an interval is either a scalar or an array over the whole limit, for losses varying with the
+    position.
+    """
+    def __init__(self, limit: Tuple[int, int]):
+        self.limit: Tuple[int, int] = limit
+        self.coverage = 0.0
+        self.length = limit[1] - limit[0]
+        self.miss_prob = np.ones(self.length)
+
+    def slice_of(self, interval):
+        if interval[0] < self.limit[0] or interval[1] > self.limit[1]:
+            raise ValueError(
+                f"Interval [{interval[0]}, {interval[1]}) exceeds the interval limit [{self.limit[0]}, {self.limit[1]}).")
+        window = slice(interval[0] - self.limit[0], interval[1] - self.limit[0])
+        fail_rate = interval[2]
+        if isinstance(fail_rate, np.ndarray):
+            fail_rate = fail_rate[window]
+        return window, fail_rate
+
+    def insert(self, interval):
+        window, fail_rate = self.slice_of(interval)
+        self.miss_prob[window] *= fail_rate
+
+    def get_new_coverage_all(self, interval_list):
+        coverage_ratio = 0.0
+        for i in interval_list:
+            cr = self.get_new_coverage(i, do_insert_after=True)
+            coverage_ratio = coverage_ratio + cr
+        return coverage_ratio
+
+    def get_new_coverage(self, interval, do_insert_after=False):
+        window, fail_rate = self.slice_of(interval)
+        miss_prob = self.miss_prob[window]
+        coverage_ratio = float(np.dot(miss_prob, 1 - np.broadcast_to(fail_rate, miss_prob.shape))) / self.length
+        if do_insert_after:
+            miss_prob *= fail_rate
+        self.coverage += coverage_ratio
+        return coverage_ratio
+
+    def get_remain(self):
+        return 1 - self.coverage
+
+
 if __name__ == '__main__':
     itv = ProbabilityIntervals((0, 100))
     # itv_list = [(1, 11, 0.5), (12, 22, 0.5), (31, 41, 0.5), (25, 32, 0.5), (70, 75, 0.5), (79, 84, 0.5), (75, 79, 0.5),(75, 79, 0.5)]
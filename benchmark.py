@@ -0,0 +1,215 @@
+"""
+Benchmark suite of the simulation engines.
+Every engine runs on a fixed, seeded matrix of parameter regimes; each case is timed (best and median of at least
+--repeat runs, repeated until they add up to MIN_CASE_SECONDS) and memory-profiled (peak of the Python and numpy allocations
+traced by tracemalloc, in a separate run). Results are written as JSON and, given a baseline JSON from an earlier
+run, compared case by case on the best run, failing on regressions that exceed both a ratio and an absolute delta.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 1.2
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from simulator.coverage import AlternationBroadcastConfig, CLIFABL, CoverageLatencyInference, \
+    CoverageLatencyInference4AlternationBroadcast
+from simulator.determined import BruteForceLossAdvdelaySimulator
+from simulator.sampler import AlternationBroadcastSampler, PureBleSimulator
+from utils import Log
+from utils import cache
+
+BENCHMARK_SEED = 2023
+# Latency quantiles recorded with every case, so that a faster engine returning other results stands out.
+BENCHMARK_QUANTILES = (0.5, 0.9, 0.99)
+# Trials of the Monte Carlo samplers per case.
+SAMPLER_TRIALS = 20000
+# Timed runs of a case are repeated until they add up to this long, so that millisecond cases get enough of them.
+MIN_CASE_SECONDS = 1.0
+MAX_CASE_RUNS = 200
+# Smallest slowdown and memory growth counting as a regression, whatever their ratio: below them, timing noise and
+# allocator jitter of millisecond cases routinely exceed any sensible ratio.
+MIN_REGRESSION_SECONDS = 0.05
+MIN_REGRESSION_MB = 1.0
+
+
+def _long_root_sequence(length=24, low=20, high=200):
+    return np.random.default_rng(BENCHMARK_SEED).integers(low, high, size=length).tolist()
+
+
+# Parameter regimes. Single-interval engines advertise every adv_interval, ABP engines follow root_seq.
+REGIMES = {
+    'typical': dict(adv_interval=152, root_seq=[40, 62, 87], scan_interval=1000, scan_window=150, end_time=20000,
+                    loss_rate=10, max_advdelay=10),
+    # Relative positions drift by a few ms per event, giving long hyperperiods
+    'near-coprime': dict(adv_interval=1021, root_seq=[509, 514], scan_interval=1024, scan_window=30, end_time=60000,
+                         loss_rate=10, max_advdelay=10),
+    'high-loss': dict(adv_interval=152, root_seq=[40, 62, 87], scan_interval=1000, scan_window=150, end_time=20000,
+                      loss_rate=80, max_advdelay=10),
+    'long-end-time': dict(adv_interval=152, root_seq=[40, 62, 87], scan_interval=1000, scan_window=150,
+                          end_time=120000, loss_rate=10, max_advdelay=10),
+    'long-abp': dict(adv_interval=152, root_seq=_long_root_sequence(), scan_interval=1000, scan_window=150,
+                     end_time=20000, loss_rate=10, max_advdelay=10),
+}
+
+
+def _cdf_quantiles(cdf):
+    return [int(np.searchsorted(cdf, p - 1e-12)) for p in BENCHMARK_QUANTILES]
+
+
+def _sample_quantiles(latencies):
+    latencies = np.sort(latencies)
+    return [int(latencies[int(np.ceil(p * len(latencies))) - 1]) for p in BENCHMARK_QUANTILES]
+
+
+def pure_ble(regime):
+    simulator = PureBleSimulator(regime['adv_interval'], regime['scan_interval'], regime['scan_window'],
+                                 regime['end_time'], regime['loss_rate'], regime['max_advdelay'])
+    return lambda: _sample_quantiles(simulator.simulate_batch(SAMPLER_TRIALS, seed=BENCHMARK_SEED))
+
+
+def abp_sampler(regime):
+    simulator = AlternationBroadcastSampler(AlternationBroadcastConfig(regime['root_seq']), regime['scan_interval'],
+                                            regime['scan_window'], regime['end_time'], regime['loss_rate'])
+    return lambda: _sample_quantiles(simulator.simulate_batch(SAMPLER_TRIALS, seed=BENCHMARK_SEED))
+
+
+def brute_force(regime):
+    simulator = BruteForceLossAdvdelaySimulator(regime['adv_interval'], regime['scan_interval'],
+                                                regime['scan_window'], regime['end_time'], regime['loss_rate'],
+                                                regime['max_advdelay'])
+    return lambda: _cdf_quantiles(simulator.simulate_all(to_cdf=True))
+
+
+def coverage(regime):
+    blender = CoverageLatencyInference(regime['adv_interval'], regime['scan_interval'], regime['scan_window'],
+                                       regime['end_time'])
+    return lambda: _cdf_quantiles(blender.simulate_all(to_cdf=True))
+
+
+def coverage_abp(regime):
+    blender = CoverageLatencyInference4AlternationBroadcast(AlternationBroadcastConfig(regime['root_seq']),
+                                                            regime['scan_interval'], regime['scan_window'],
+                                                            regime['end_time'])
+    return lambda: _cdf_quantiles(blender.simulate_all(to_cdf=True))
+
+
+def coverage_abp_lossy(regime):
+    blender = CLIFABL(AlternationBroadcastConfig(regime['root_seq']), regime['scan_interval'], regime['scan_window'],
+                      regime['end_time'], regime['loss_rate'] / 100)
+    return lambda: _cdf_quantiles(blender.simulate_all(to_cdf=True))
+
+
+# Engine name -> builder of a no-argument run returning the latency quantiles of a regime.
+ENGINES = {
+    'PureBleSimulator': pure_ble,
+    'AlternationBroadcastSampler': abp_sampler,
+    'BruteForceLossAdvdelaySimulator': brute_force,
+    'CoverageLatencyInference': coverage,
+    'CoverageLatencyInference4AlternationBroadcast': coverage_abp,
+    'CLIFABL': coverage_abp_lossy,
+}
+
+
+def run_case(engine, regime_name, repeat=3):
+    """
+    Best and median wall time over at least repeat runs (more until they add up to MIN_CASE_SECONDS), peak traced
+    memory and latency quantiles of one engine on one regime. Scheduling and cache noise only ever add time, so the
+    best run is the one compared against baselines.
+    """
+    regime = REGIMES[regime_name]
+    seconds = []
+    quantiles = None
+    while len(seconds) < repeat or (sum(seconds) < MIN_CASE_SECONDS and len(seconds) < MAX_CASE_RUNS):
+        run = ENGINES[engine](regime)
+        start = time.perf_counter()
+        quantiles = run()
+        seconds.append(time.perf_counter() - start)
+
+    run = ENGINES[engine](regime)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'engine': engine, 'regime': regime_name, 'seconds': min(seconds),
+            'median_seconds': float(np.median(seconds)), 'runs': len(seconds),
+            'peak_mb': peak / 2 ** 20,
+            'quantiles': dict(zip((str(p) for p in BENCHMARK_QUANTILES), quantiles))}
+
+
+def run_all(engines=None, regimes=None, repeat=3):
+    # Cached results would time the cache, not the engines
+    cache.disable()
+    results = []
+    for engine in engines or ENGINES:
+        for regime_name in regimes or REGIMES:
+            result = run_case(engine, regime_name, repeat)
+            Log.I('Benchmark', f"{engine} on {regime_name}: {result['seconds']:.3f} s, {result['peak_mb']:.1f} MB")
+            results.append(result)
+    return {'meta': {'seed': BENCHMARK_SEED, 'repeat': repeat, 'python': platform.python_version(),
+                     'numpy': np.__version__, 'platform': platform.platform(), 'time': time.time()},
+            'regimes': REGIMES, 'results': results}
+
+
+def compare(report, baseline, threshold=1.2, min_seconds=MIN_REGRESSION_SECONDS, min_mb=MIN_REGRESSION_MB):
+    """
+    Per case of report also present in baseline with the same regime parameters: time and memory ratios, whether
+    the quantiles changed, and whether it regressed, i.e. got more than threshold times and at least min_seconds
+    slower, or more than threshold times and at least min_mb bigger.
+    """
+    baseline_cases = {(r['engine'], r['regime']): r for r in baseline['results']}
+    comparisons = []
+    for result in report['results']:
+        reference = baseline_cases.get((result['engine'], result['regime']))
+        if reference is None or baseline['regimes'].get(result['regime']) != report['regimes'][result['regime']]:
+            continue
+        time_ratio = result['seconds'] / max(reference['seconds'], 1e-9)
+        memory_ratio = result['peak_mb'] / max(reference['peak_mb'], 1e-9)
+        comparisons.append({'engine': result['engine'], 'regime': result['regime'], 'time_ratio': time_ratio,
+                            'memory_ratio': memory_ratio,
+                            'quantiles_changed': result['quantiles'] != reference['quantiles'],
+                            'regressed': (time_ratio > threshold and
+                                          result['seconds'] - reference['seconds'] >= min_seconds) or
+                                         (memory_ratio > threshold and
+                                          result['peak_mb'] - reference['peak_mb'] >= min_mb)})
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulation engines.')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown or memory growth ratio over the baseline counting as a regression')
+    parser.add_argument('--min-delta', type=float, default=MIN_REGRESSION_SECONDS,
+                        help='smallest slowdown (s) counting as a regression')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), help='engines to run (default: all)')
+    parser.add_argument('--regimes', nargs='+', choices=list(REGIMES), help='regimes to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='minimum timed runs per case')
+    args = parser.parse_args()
+
+    report = run_all(args.engines, args.regimes, args.repeat)
+    comparisons = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            comparisons = compare(report, json.load(f), args.threshold, args.min_delta)
+        report['comparison'] = comparisons
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    for c in comparisons:
+        flags = ('REGRESSED ' if c['regressed'] else '') + ('QUANTILES CHANGED' if c['quantiles_changed'] else '')
+        print(f"{c['engine']:<46}{c['regime']:<15}time x{c['time_ratio']:.2f}  memory x{c['memory_ratio']:.2f}  "
+              f"{flags}")
+    return 1 if any(c['regressed'] for c in comparisons) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,7 @@ import numpy as np
 from matplotlib import pyplot as plt
 from scipy.interpolate import interp1d
 
-from algo.intervals import Intervals
+from algo.intervals import Intervals, SortedIntervals
 from simulator.coverage import CoverageLatencyInference, CoverageLatencyInference4AlternationBroadcast, \
     AlternationBroadcastConfig, CLIFABL
 from simulator.determined import BruteForceLossAdvdelaySimulator
@@ -201,6 +201,79 @@ def abp_compare():
     *********END OF YOUR CODE***********
     """
 
+def intervals_test():
+    """
+    SortedIntervals against Intervals on the footprints of the coverage engines (fixed-width windows, split at the
+    end of the scan interval), and against a covered-position mask on arbitrary intervals.
+    """
+    for _ in range(200):
+        scan_interval = random.randint(100, 6000)
+        scan_window = random.randint(1, scan_interval)
+        adv_interval = random.randint(1, 6000)
+        reference, candidate = Intervals((0, scan_interval)), SortedIntervals((0, scan_interval))
+        for adv_ts in range(0, 50 * adv_interval, adv_interval):
+            rel_pos = adv_ts % scan_interval
+            if rel_pos >= scan_window - 1:
+                interval = (rel_pos - scan_window + 1, rel_pos + 1)
+                assert reference.get_new_coverage(interval, do_insert_after=True) == \
+                    candidate.get_new_coverage(interval, do_insert_after=True)
+            else:
+                interval_list = [(scan_interval - (scan_window - rel_pos - 1), scan_interval), (0, rel_pos + 1)]
+                assert reference.get_new_coverage_all(interval_list) == candidate.get_new_coverage_all(interval_list)
+            assert reference.get_remain(use_int=True) == candidate.get_remain(use_int=True)
+            assert reference.get_remain() == candidate.get_remain()
+
+    for _ in range(200):
+        limit = random.randint(10, 500)
+        candidate = SortedIntervals((0, limit))
+        covered = np.zeros(limit, dtype=bool)
+        for _ in range(random.randint(1, 60)):
+            start = random.randint(0, limit - 1)
+            interval = (start, random.randint(start + 1, limit))
+            coverage_int, _ = candidate.get_new_coverage(interval, do_insert_after=True)
+            assert coverage_int == np.count_nonzero(~covered[interval[0]:interval[1]])
+            covered[interval[0]:interval[1]] = True
+            merged = np.flatnonzero(np.diff(np.concatenate(([0], covered.astype(int), [0]))))
+            assert candidate.interval_sorted == list(zip(merged[::2], merged[1::2]))
+    print("SortedIntervals matches Intervals")
+
+
+def geometric_tail_test():
+    """
+    CLIFABL past its hyperperiod on a long root sequence must step through the first hyperperiod only, extrapolating
+    every later event, and use no more memory than stepping through the first hyperperiod alone.
+    """
+    import tracemalloc
+    from utils import profiler
+    root_seq = np.random.default_rng(0).integers(60, 137, 70)
+    root_seq[-1] += 6893 - root_seq.sum()
+    abp_config = AlternationBroadcastConfig(root_seq.tolist())
+    schedule = abp_config.schedule()
+    hyperperiod = schedule.hyperperiod(1000) * abp_config.itv_sum
+    peaks = []
+    for end_time in (hyperperiod - 1000, hyperperiod + 7000):
+        blender = CLIFABL(abp_config=abp_config, scan_interval=1000, scan_window=500, end_time=end_time,
+                          fail_rate=0.3)
+        profiler.reset()
+        profiler.enable()
+        try:
+            blender.try_cover(0)
+        finally:
+            profiler.disable()
+        counters = profiler.profile()['counters']
+        assert counters['CLIFABL.events'] == len(schedule.timestamps(0, min(end_time, hyperperiod - 1)))
+        assert counters.get('CLIFABL.extrapolated_events', 0) == \
+            len(schedule.timestamps(0, end_time)) - counters['CLIFABL.events']
+        tracemalloc.start()
+        blender.try_cover(0)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    base_peak, tail_peak = peaks
+    print(f"Peak memory of the first hyperperiod: {base_peak / 2 ** 20:.1f} MB; "
+          f"with tail: {tail_peak / 2 ** 20:.1f} MB")
+    assert tail_peak <= 1.5 * base_peak
+
+
 if __name__ == '__main__':
     Log.debug()
     # abp_loss_test()
@@ -1,10 +1,20 @@
+import bisect
+import math
 import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from typing import List
 
 import numpy as np
 
-from algo.intervals import Intervals, ProbabilityIntervals
-from utils import Log
+from algo.convolution import box_aggregate
+from algo.distribution import LatencyDistribution
+from algo.intervals import ProbabilityIntervals, ProbabilityVector, SortedIntervals
+from utils import Log, profiler
+from utils.cache import cached
+
+# Distinct per-hyperperiod miss factors up to which CLIFABL extrapolates the tail instead of stepping every event.
+GEOMETRIC_TAIL_MAX_FACTORS = 64
 
 
 class CoverageLatencyInference:
@@ -17,9 +27,11 @@ class CoverageLatencyInference:
     def try_cover(self):
         Log.V("CoverageInference", "Coverage Start")
         adv_ts = 0
-        coverage_stat = Intervals((0, self.scan_interval))
+        coverage_stat = SortedIntervals((0, self.scan_interval))
         latency2prob = dict()
-        while adv_ts <= self.end_time:
+        # Relative positions repeat after one hyperperiod, later events add no coverage
+        hyperperiod = self.scan_interval // math.gcd(self.adv_interval, self.scan_interval) * self.adv_interval
+        while adv_ts <= min(self.end_time, hyperperiod - 1):
             latency = adv_ts
             rel_pos = adv_ts % self.scan_interval
             if rel_pos >= self.scan_window - 1:
@@ -37,6 +49,8 @@ class CoverageLatencyInference:
             if coverage_stat.get_remain(use_int=True) == 0:
                 print("No segment left")
                 break
+        profiler.count('CoverageLatencyInference.events', len(latency2prob))
+        profiler.count('CoverageLatencyInference.fragments', len(coverage_stat.interval_sorted))
         if self.end_time in latency2prob.keys():
             latency2prob[self.end_time] += coverage_stat.get_remain(use_int=True)
         else:
@@ -44,12 +58,13 @@ class CoverageLatencyInference:
         Log.V("CoverageInference", "Coverage Complete")
         return latency2prob
 
+    @cached()
     def simulate_all(self, to_cdf=True):
-        base_latency2prob = self.try_cover()
-        latency_pdf = np.zeros(self.end_time + 1)
-        for phi_a in range(self.adv_interval):
-            for latency, prob in base_latency2prob.items():
-                latency_pdf[min(latency + phi_a, self.end_time)] += prob
+        with profiler.timer(f'{type(self).__name__}.try_cover'):
+            base_latency2prob = self.try_cover()
+        with profiler.timer(f'{type(self).__name__}.range_entrance'):
+            latency_pdf = box_aggregate(list(base_latency2prob.keys()), list(base_latency2prob.values()),
+                                        self.adv_interval, self.end_time + 1)
         Log.V("CoverageInference", "Calculation Complete")
         prob_sum = sum(latency_pdf)
         pdf = latency_pdf / prob_sum
@@ -59,6 +74,69 @@ class CoverageLatencyInference:
             return cdf
         return pdf
 
+    def simulate_distribution(self, dtype=np.float64):
+        """simulate_all as a LatencyDistribution, without expanding the Range-Entrance Projection to end_time bins."""
+        base_latency2prob = self.try_cover()
+        return LatencyDistribution.from_boxes(list(base_latency2prob.keys()), self.adv_interval,
+                                              list(base_latency2prob.values()), self.end_time, dtype)
+
+
+class RotationCoverageInference(CoverageLatencyInference):
+    """
+    CoverageLatencyInference computing try_cover from the structure of the rotation adv_ts -> adv_ts + adv_interval
+    on the circle of length scan_interval, instead of inserting every footprint.
+    The footprint of event k is the arc of scan_window positions ending at its relative position. An arc of the same
+    length can only overlap it from one of its ends, so its new coverage only depends on the nearest earlier event
+    position on either side, at distances gap_below and gap_above:
+        clip(min(scan_window, gap_below) - max(0, scan_window - gap_above), 0)
+    These nearest distances are the running minima of i * adv_interval mod scan_interval and its opposite, and
+    both change only when their index sum is reached (three-gap theorem): the larger gap then loses the smaller
+    one, as in the subtraction form of Euclid's algorithm. Runs of subtractions leaving the coverage unchanged are
+    taken at once by a division, so the work is logarithmic per coverage level, plus the emitted latencies.
+    Events adding no coverage are left out of latency2prob, which does not change simulate_all.
+    """
+    def try_cover(self):
+        Log.V("CoverageInference", "Coverage Start")
+        event_count = self.end_time // self.adv_interval + 1
+        step = self.adv_interval % self.scan_interval
+        latency2prob = {0: self.scan_window}
+        covered = self.scan_window
+
+        # Event k >= next_event sees nearest earlier positions gap_below (event below_idx) and gap_above (above_idx)
+        below_idx, gap_below, above_idx, gap_above = 1, step, 1, self.scan_interval - step
+        next_event = 1
+        while step != 0 and next_event < event_count and covered < self.scan_interval:
+            if gap_below > gap_above:
+                # Subtractions from gap_below keep the coverage unchanged while gap_below >= scan_window
+                runs = max(1, min((gap_below - self.scan_window) // gap_above + 1, (gap_below - 1) // gap_above))
+                last_event = below_idx + runs * above_idx
+            else:
+                runs = max(1, min((gap_above - self.scan_window) // gap_below + 1, (gap_above - 1) // gap_below))
+                last_event = above_idx + runs * below_idx
+            coverage = min(self.scan_window, gap_below) - max(0, self.scan_window - gap_above)
+            if coverage <= 0:
+                # Gaps only shrink: no later event adds coverage
+                break
+            events = np.arange(next_event, min(last_event, event_count))
+            latency2prob.update(zip((events * self.adv_interval).tolist(), [coverage] * len(events)))
+            covered += coverage * len(events)
+            if gap_below == gap_above:
+                # Event below_idx + above_idx returns to the start: every position is visited
+                break
+            if gap_below > gap_above:
+                below_idx, gap_below = last_event, gap_below - runs * gap_above
+            else:
+                above_idx, gap_above = last_event, gap_above - runs * gap_below
+            next_event = last_event
+
+        profiler.count('RotationCoverageInference.events', len(latency2prob))
+        remain = self.scan_interval - covered
+        if remain < 0:
+            raise ValueError("Fault in interval calculation")
+        latency2prob[self.end_time] = latency2prob.get(self.end_time, 0) + remain
+        Log.V("CoverageInference", "Coverage Complete")
+        return latency2prob
+
 
 # class AlternationBroadcastConfig:
 # def __init__(self):
@@ -94,6 +172,7 @@ class AlternationBroadcastConfig:
     def __init__(self, root_sequence: List[int]):
         self.root_seq = root_sequence
         self.itv_sum = sum(root_sequence)
+        self.itv_prefix = np.cumsum(root_sequence).tolist()
         self.seq_start_index = 0
         self.repeat_pt = 0
 
@@ -116,14 +195,90 @@ class AlternationBroadcastConfig:
 
     def rand_start(self):
         rand_val = random.randint(0, self.itv_sum)
-        s = 0
-        i = 0
-        while True:
-            if s + self[i] >= rand_val:
-                break
-            s += self[i]
-            i += 1
-        return i, rand_val - s
+        i = bisect.bisect_left(self.itv_prefix, rand_val)
+        return i, rand_val - (self.itv_prefix[i] - self[i])
+
+    def schedule(self):
+        return AlternationBroadcastSchedule(self.root_seq)
+
+
+class AlternationBroadcastSchedule:
+    """
+    Immutable, array-backed counterpart of AlternationBroadcastConfig.
+    Row i of step_table lists the intervals that follow an event advertised from start index i, in the order
+    next_interval() yields them after set_seq_start_index(i); offset_table holds their prefix sums, so the k-th
+    event after the start lies (k // len) * itv_sum + offset_table[i, k % len] later.
+    """
+    def __init__(self, root_sequence: List[int]):
+        self.root_seq = np.asarray(root_sequence, dtype=np.int64)
+        self.itv_sum = int(self.root_seq.sum())
+        self.itv_prefix = np.cumsum(self.root_seq)
+        seq_len = len(self.root_seq)
+        order = (np.arange(seq_len)[:, None] + 2 + np.arange(seq_len)[None, :]) % seq_len
+        self.step_table = self.root_seq[order]
+        self.offset_table = np.zeros((seq_len, seq_len + 1), dtype=np.int64)
+        np.cumsum(self.step_table, axis=1, out=self.offset_table[:, 1:])
+        for arr in (self.root_seq, self.itv_prefix, self.step_table, self.offset_table):
+            arr.setflags(write=False)
+
+    def __len__(self):
+        return len(self.root_seq)
+
+    def __getitem__(self, item):
+        return self.root_seq[item]
+
+    def rand_start(self, rng, size):
+        """Vectorized rand_start(): start indices and first-event phases of size trials."""
+        return self.start_at(rng.integers(0, self.itv_sum + 1, size=size))
+
+    def start_at(self, rand_val):
+        """Start indices and first-event phases matching given rand_start() draws in [0, itv_sum]."""
+        start_index = np.searchsorted(self.itv_prefix, rand_val, side='left')
+        return start_index, rand_val - (self.itv_prefix[start_index] - self.root_seq[start_index])
+
+    def event_offsets(self, start_index, event_index):
+        """Time from the start event to the event_index-th event after it. Both arguments broadcast."""
+        period, pos = np.divmod(event_index, len(self.root_seq))
+        return period * self.itv_sum + self.offset_table[start_index, pos]
+
+    def hyperperiod(self, scan_interval, tolerance=0, end_time=None):
+        """
+        Root-sequence periods after which the event phases modulo scan_interval repeat, or, when tolerance (ms) is
+        positive, nearly repeat: treating a near-repeat as exact shifts every later repeat by its drift once more, so
+        it is accepted only if the drift summed over the repeats up to end_time (a single one without end_time) stays
+        within tolerance.
+        """
+        exact = scan_interval // math.gcd(self.itv_sum, scan_interval)
+        periods = np.arange(1, exact + 1)
+        drift = periods * self.itv_sum % scan_interval
+        repeats = 1 if end_time is None else np.maximum(end_time // (periods * self.itv_sum), 1)
+        return int(np.argmax(np.minimum(drift, scan_interval - drift) * repeats <= tolerance)) + 1
+
+    def timestamps(self, start_index, end_time, first_ts=0):
+        """All advertising timestamps up to end_time of a sequence whose first event at first_ts uses start_index."""
+        if first_ts > end_time:
+            return np.zeros(0, dtype=np.int64)
+        periods = (end_time - first_ts) // self.itv_sum + 1
+        ts = first_ts + (np.arange(periods, dtype=np.int64)[:, None] * self.itv_sum +
+                         self.offset_table[start_index, :-1][None, :]).ravel()
+        return ts[ts <= end_time]
+
+
+def _try_cover(engine, start_index):
+    return engine.try_cover(start_index)
+
+
+def cover_start_indices(engine, workers=1):
+    """
+    latency2prob of every start index of an alternation broadcast engine, in start-index order.
+    try_cover only reads the immutable schedule of the root sequence, so start indices are independent and, unless
+    workers is 1, run over a process pool (None for all cores).
+    """
+    start_indices = range(len(engine.abp_config))
+    if workers == 1 or len(start_indices) == 1:
+        return [engine.try_cover(i) for i in start_indices]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_try_cover, repeat(engine), start_indices))
 
 
 class CoverageLatencyInference4AlternationBroadcast:
@@ -135,11 +290,12 @@ class CoverageLatencyInference4AlternationBroadcast:
 
     def try_cover(self, start_index):
         Log.V("CoverageInference", "Coverage Start")
-        self.abp_config.set_seq_start_index(start_index)
-        adv_ts = 0
-        coverage_stat = Intervals((0, self.scan_interval))
+        coverage_stat = SortedIntervals((0, self.scan_interval))
         latency2prob = dict()
-        while adv_ts <= self.end_time:
+        schedule = self.abp_config.schedule()
+        # Relative positions repeat after one hyperperiod, later events add no coverage
+        hyperperiod = schedule.hyperperiod(self.scan_interval) * schedule.itv_sum
+        for adv_ts in schedule.timestamps(start_index, min(self.end_time, hyperperiod - 1)).tolist():
             latency = adv_ts
             rel_pos = adv_ts % self.scan_interval
             if rel_pos >= self.scan_window - 1:
@@ -151,11 +307,12 @@ class CoverageLatencyInference4AlternationBroadcast:
                 prob, _ = coverage_stat.get_new_coverage_all(interval_list=[
                     (self.scan_interval - (self.scan_window - rel_pos - 1), self.scan_interval), (0, rel_pos + 1)])
             latency2prob[latency] = prob
-            adv_ts += self.abp_config.next_interval()
             if coverage_stat.get_remain(use_int=True) < 0:
                 raise ValueError("Fault in interval calculation")
             if coverage_stat.get_remain(use_int=True) == 0:
                 break
+        profiler.count('CoverageLatencyInference4AlternationBroadcast.events', len(latency2prob))
+        profiler.count('CoverageLatencyInference4AlternationBroadcast.fragments', len(coverage_stat.interval_sorted))
         if self.end_time in latency2prob.keys():
             latency2prob[self.end_time] += coverage_stat.get_remain(use_int=True)
         else:
@@ -163,14 +320,18 @@ class CoverageLatencyInference4AlternationBroadcast:
         Log.V("CoverageInference", "Coverage Complete")
         return latency2prob
 
-    def simulate_all(self, to_cdf=True):
-        latency_pdf = np.zeros(self.end_time + 1)
-        for i in range(len(self.abp_config)):
-            base_latency2prob = self.try_cover(i)
-            for phi_a in range(self.abp_config[i]):
-                for latency, prob in base_latency2prob.items():
-                    latency_pdf[min(latency + phi_a, self.end_time)] += prob
+    @cached(ignore=('workers',))
+    def simulate_all(self, to_cdf=True, workers=1):
+        latencies, probs, widths = [], [], []
+        with profiler.timer(f'{type(self).__name__}.try_cover'):
+            base_latency2probs = cover_start_indices(self, workers)
+        for i, base_latency2prob in enumerate(base_latency2probs):
+            latencies += list(base_latency2prob.keys())
+            probs += list(base_latency2prob.values())
+            widths += [self.abp_config[i]] * len(base_latency2prob)
             Log.V("CoverageInference", "Calculation Complete")
+        with profiler.timer(f'{type(self).__name__}.range_entrance'):
+            latency_pdf = box_aggregate(latencies, probs, widths, self.end_time + 1)
         prob_sum = sum(latency_pdf)
         pdf = latency_pdf / prob_sum
         if to_cdf:
@@ -179,37 +340,85 @@ class CoverageLatencyInference4AlternationBroadcast:
             return cdf
         return pdf
 
+    def simulate_distribution(self, dtype=np.float64, workers=1):
+        """simulate_all as a LatencyDistribution, without expanding the Range-Entrance Projection to end_time bins."""
+        starts, widths, weights = [], [], []
+        for i, base_latency2prob in enumerate(cover_start_indices(self, workers)):
+            starts += list(base_latency2prob.keys())
+            weights += list(base_latency2prob.values())
+            widths += [self.abp_config[i]] * len(base_latency2prob)
+        return LatencyDistribution.from_boxes(starts, widths, weights, self.end_time, dtype)
+
 
 class CLIFABL:
-    def __init__(self, abp_config: AlternationBroadcastConfig, scan_interval, scan_window, end_time, fail_rate):
+    """
+    Coverage latency inference for alternation broadcast under loss ratio fail_rate.
+    backend selects the coverage state: 'vector' (ProbabilityVector, a miss probability per scan phase) or
+    'intervals' (ProbabilityIntervals, the reference fragment list). With the 'vector' backend fail_rate may also be
+    a sequence of scan_interval loss ratios, one per scan phase.
+    Event phases modulo scan_interval repeat after a hyperperiod, from which on every hyperperiod multiplies the
+    miss probability of each phase by the same factor. try_cover runs the backend over the first hyperperiod only
+    and extrapolates the later events geometrically (see geometric_tail). A positive hyperperiod_tolerance (ms)
+    accepts a shorter near-repeat whose phases drift by at most that much in total up to end_time, trading accuracy
+    for speed.
+    """
+    BACKENDS = {'vector': ProbabilityVector, 'intervals': ProbabilityIntervals}
+
+    def __init__(self, abp_config: AlternationBroadcastConfig, scan_interval, scan_window, end_time, fail_rate,
+                 backend='vector', hyperperiod_tolerance=0):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown coverage backend {backend}.")
+        if np.ndim(fail_rate) > 0:
+            if backend != 'vector':
+                raise ValueError("Per-position loss ratios require the vector backend.")
+            if len(fail_rate) != scan_interval:
+                raise ValueError("Per-position loss ratios must cover the scan interval.")
+            # Kept as a tuple so that it identifies cached results
+            fail_rate = tuple(float(f) for f in fail_rate)
         self.abp_config = abp_config
         self.scan_interval = scan_interval
         self.scan_window = scan_window
         self.end_time = end_time
         self.fail_rate = fail_rate
+        self.backend = backend
+        self.hyperperiod_tolerance = hyperperiod_tolerance
 
     def try_cover(self, start_index):
         Log.V("CoverageInference", "Coverage Start")
-        self.abp_config.set_seq_start_index(start_index)
-        adv_ts = 0
-        coverage_stat = ProbabilityIntervals((0, self.scan_interval))
+        coverage_stat = self.BACKENDS[self.backend]((0, self.scan_interval))
+        fail_rate = np.asarray(self.fail_rate) if isinstance(self.fail_rate, tuple) else self.fail_rate
         latency2prob = dict()
-        while adv_ts <= self.end_time:
+        schedule = self.abp_config.schedule()
+        hyperperiod = schedule.hyperperiod(self.scan_interval, self.hyperperiod_tolerance, self.end_time) * \
+            schedule.itv_sum
+        event_ts = schedule.timestamps(start_index, min(self.end_time, hyperperiod - 1))
+        tail = self.geometric_tail(event_ts, hyperperiod, fail_rate) if self.end_time >= hyperperiod else None
+        if self.end_time >= hyperperiod and tail is None:
+            event_ts = schedule.timestamps(start_index, self.end_time)
+        for adv_ts in event_ts.tolist():
             latency = adv_ts
             rel_pos = adv_ts % self.scan_interval
             if rel_pos >= self.scan_window - 1:
                 # print(f"Interval: ({rel_pos - self.scan_window + 1}, {rel_pos + 1})")
-                prob = coverage_stat.get_new_coverage(interval=(rel_pos - self.scan_window + 1, rel_pos + 1, self.fail_rate),
+                prob = coverage_stat.get_new_coverage(interval=(rel_pos - self.scan_window + 1, rel_pos + 1, fail_rate),
                                                          do_insert_after=True)
             else:
                 # print(f"Interval: ({self.scan_interval - (self.scan_window - rel_pos - 1)}, {self.scan_interval}) and (0, {rel_pos + 1})")
                 prob = coverage_stat.get_new_coverage_all(interval_list=[
-                    (self.scan_interval - (self.scan_window - rel_pos - 1), self.scan_interval, self.fail_rate), (0, rel_pos + 1, self.fail_rate)])
+                    (self.scan_interval - (self.scan_window - rel_pos - 1), self.scan_interval, fail_rate), (0, rel_pos + 1, fail_rate)])
             latency2prob[latency] = prob
             if coverage_stat.get_remain() < 0:
                 coverage_stat.coverage = 1.0
                 break
-            adv_ts += self.abp_config.next_interval()
+        else:
+            if tail is not None:
+                tail_ts, tail_prob = tail
+                latency2prob.update(zip(tail_ts.tolist(), tail_prob.tolist()))
+                coverage_stat.coverage += float(tail_prob.sum())
+                profiler.count('CLIFABL.extrapolated_events', len(tail_ts))
+        profiler.count('CLIFABL.events', len(event_ts))
+        if self.backend == 'intervals':
+            profiler.count('CLIFABL.fragments', len(coverage_stat.interval_sorted))
 
         if self.end_time in latency2prob.keys():
             latency2prob[self.end_time] += coverage_stat.get_remain()
@@ -218,14 +427,72 @@ class CLIFABL:
         Log.V("CoverageInference", "Coverage Complete")
         return latency2prob
 
-    def simulate_all(self, to_cdf=True):
-        latency_pdf = np.zeros(self.end_time + 1)
-        for i in range(len(self.abp_config)):
-            base_latency2prob = self.try_cover(i)
-            for phi_a in range(self.abp_config[i]):
-                for latency, prob in base_latency2prob.items():
-                    latency_pdf[min(latency + phi_a, self.end_time)] += prob
+    def geometric_tail(self, event_ts, hyperperiod, fail_rate):
+        """
+        Timestamps and discovery probabilities of the events after the first hyperperiod, event_ts being those of the
+        first one. Phase p of event k is missed before it with probability q_p ** c_kp, c_kp the events covering p
+        before k in the hyperperiod, and every full hyperperiod multiplies it by r_p = q_p ** c_p, c_p the events
+        covering p in a hyperperiod. The copy of event k in hyperperiod j thus discovers
+            sum_p (1 - q_p) * q_p ** c_kp * r_p ** j / scan_interval
+        over its footprint, a sum of geometric sequences over the distinct factors r_p.
+        c_kp comes from a running per-phase cover count and c_p from a difference array, as in cover_count_histograms,
+        so memory stays linear in scan_interval plus the events times the distinct factors. Returns None when there
+        are more than GEOMETRIC_TAIL_MAX_FACTORS of them (typically per-phase loss ratios); try_cover then steps every
+        event.
+        """
+        scalar_rate = np.ndim(fail_rate) == 0
+        fail_rate = np.broadcast_to(np.asarray(fail_rate, dtype=np.float64), (self.scan_interval,))
+        # Footprint of event k: the scan_window phases from window_starts[k] on, modulo scan_interval
+        window_starts = (event_ts - self.scan_window + 1) % self.scan_interval
+        edges = np.bincount(window_starts, minlength=2 * self.scan_interval) - \
+            np.bincount(window_starts + self.scan_window, minlength=2 * self.scan_interval)
+        unfolded = np.cumsum(edges)
+        covers = unfolded[:self.scan_interval] + unfolded[self.scan_interval:]
+        factors, factor_idx = np.unique(fail_rate ** covers, return_inverse=True)
+        if len(factors) > GEOMETRIC_TAIL_MAX_FACTORS:
+            return None
+        # A scalar loss ratio looks its weights up instead of raising it per footprint entry
+        weights = (1 - fail_rate[0]) * fail_rate[0] ** np.arange(covers.max() + 1) if scalar_rate else None
+
+        grouped = np.zeros((len(event_ts), len(factors)))
+        cover_count = np.zeros(self.scan_interval, dtype=np.int64)
+        # Phases of a footprint wrapping past scan_interval read their factors from the doubled table
+        wrapped_idx = np.concatenate((factor_idx, factor_idx))
+        wrapped_rate = np.concatenate((fail_rate, fail_rate))
+        for k, start in enumerate(window_starts.tolist()):
+            stop = start + self.scan_window
+            if stop <= self.scan_interval:
+                cover_before = cover_count[start:stop].copy()
+                cover_count[start:stop] += 1
+            else:
+                cover_before = np.concatenate((cover_count[start:], cover_count[:stop - self.scan_interval]))
+                cover_count[start:] += 1
+                cover_count[:stop - self.scan_interval] += 1
+            if scalar_rate:
+                weight = weights[cover_before]
+            else:
+                weight = (1 - wrapped_rate[start:stop]) * wrapped_rate[start:stop] ** cover_before
+            grouped[k] = np.bincount(wrapped_idx[start:stop], weights=weight, minlength=len(factors))
+        grouped /= self.scan_interval
+
+        hyperperiods = np.arange(1, (self.end_time - event_ts[0]) // hyperperiod + 1)
+        tail_prob = grouped @ factors[:, None] ** hyperperiods[None, :]
+        tail_ts = event_ts[:, None] + hyperperiods[None, :] * hyperperiod
+        in_range = (tail_ts <= self.end_time).T
+        return tail_ts.T[in_range], tail_prob.T[in_range]
+
+    @cached(ignore=('workers',))
+    def simulate_all(self, to_cdf=True, workers=1):
+        latencies, probs, widths = [], [], []
+        with profiler.timer(f'{type(self).__name__}.try_cover'):
+            base_latency2probs = cover_start_indices(self, workers)
+        for i, base_latency2prob in enumerate(base_latency2probs):
+            latencies += list(base_latency2prob.keys())
+            probs += list(base_latency2prob.values())
+            widths += [self.abp_config[i]] * len(base_latency2prob)
             Log.V("CoverageInference", "Calculation Complete")
+        with profiler.timer(f'{type(self).__name__}.range_entrance'):
+            latency_pdf = box_aggregate(latencies, probs, widths, self.end_time + 1)
         prob_sum = sum(latency_pdf)
         pdf = latency_pdf / prob_sum
         if to_cdf:
@@ -233,3 +500,12 @@ class CLIFABL:
             cdf[-1] = 1.0
             return cdf
         return pdf
+
+    def simulate_distribution(self, dtype=np.float64, workers=1):
+        """simulate_all as a LatencyDistribution, without expanding the Range-Entrance Projection to end_time bins."""
+        starts, widths, weights = [], [], []
+        for i, base_latency2prob in enumerate(cover_start_indices(self, workers)):
+            starts += list(base_latency2prob.keys())
+            weights += list(base_latency2prob.values())
+            widths += [self.abp_config[i]] * len(base_latency2prob)
+        return LatencyDistribution.from_boxes(starts, widths, weights, self.end_time, dtype)
@@ -1,6 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import numpy as np
 
-from algo.accumulator import ProbabilitySummationAccumulator
+from algo.accumulator import VectorizedSummationAccumulator
+from algo.convolution import box_filter, clipped_convolve
+from algo.distribution import LatencyDistribution
+from utils import profiler
+from utils.cache import cached
+
+# Phase offsets per unit of work. Fixed so that the summation order, hence the result, never depends on the number of
+# workers.
+PHASE_CHUNK_SIZE = 64
+
+
+def _project_phase_chunk(simulator, projection, phi_s_range, phase_projection_times, adv_ts_delay_pdf):
+    return simulator.project_phase_chunk(projection, phi_s_range, phase_projection_times, adv_ts_delay_pdf)
 
 
 class BruteForceLossAdvdelaySimulator:
@@ -18,6 +33,8 @@ class BruteForceLossAdvdelaySimulator:
         self.max_advdelay = max_advdelay
 
     def simulate_once(self, first_adv_ts, first_scan_down_ts):
+        if self.adv_interval <= self.scan_window:
+            return self.simulate_once_ta_le_ds(first_adv_ts, first_scan_down_ts)
         adv_cur_base_ts = first_adv_ts
         scan_cur_up_ts = first_scan_down_ts - self.scan_window
         adv_evt_count = 1
@@ -25,15 +42,18 @@ class BruteForceLossAdvdelaySimulator:
         adv_ts_delay_range = self.max_advdelay
         base_prob = 1
         latency2pdf = dict()
-        prob_accumulator = ProbabilitySummationAccumulator(self.max_advdelay)
+        prob_accumulator = VectorizedSummationAccumulator(self.max_advdelay)
 
         while scan_cur_up_ts <= self.end_time:
-            while adv_cur_base_ts + adv_ts_delay_range < scan_cur_up_ts:
-                # Current scan window occur after all possible positions of current advertise event
-                adv_cur_base_ts += self.adv_interval
-                adv_ts_delay_range += self.max_advdelay
-                adv_evt_count += 1
-                prob_accumulator.next_layer()
+            if adv_cur_base_ts + adv_ts_delay_range < scan_cur_up_ts:
+                # Current scan window occur after all possible positions of current advertise event:
+                # skip every event whose positions all fall before the window at once
+                skipped = -(-(scan_cur_up_ts - adv_cur_base_ts - adv_ts_delay_range) //
+                            (self.adv_interval + self.max_advdelay))
+                adv_cur_base_ts += skipped * self.adv_interval
+                adv_ts_delay_range += skipped * self.max_advdelay
+                adv_evt_count += skipped
+                prob_accumulator.extend(skipped)
             scan_cur_down_ts = scan_cur_up_ts + self.scan_window
             if adv_cur_base_ts < scan_cur_down_ts:
                 # At least a partition of possible positions of current advertise event occurs in current scan window
@@ -59,31 +79,141 @@ class BruteForceLossAdvdelaySimulator:
             latency2pdf[self.inf] = base_prob  # (base_prob, -1)
         return latency2pdf
 
-    def simulate_all_ta_le_ts(self, to_cdf):
+    def simulate_once_ta_le_ds(self, first_adv_ts, first_scan_down_ts):
+        """
+        Base case when adv_interval <= scan_window. Several advertise events share a scan window and the positions of
+        consecutive events overlap, so events are followed one at a time instead of window by window: the layer of
+        event e holds the probability of e occurring at each position with every earlier event missed, is reduced
+        at all of its positions covered by any scan window, then convolved with one advDelay draw into event e + 1.
+        """
+        scan_first_up_ts = first_scan_down_ts - self.scan_window
+        delay_pdf = np.full(self.max_advdelay + 1, 1 / (self.max_advdelay + 1))
+        layer = delay_pdf.copy()
+        layer_start_ts = first_adv_ts
+        base_prob = 1
+        latency2pdf = dict()
 
-        raise NotImplementedError(r"Validity of this implementation when $T_a < d_s$ is under discussion.")
+        while layer_start_ts <= self.end_time:
+            adv_ts = layer_start_ts + np.arange(len(layer))
+            in_scan_win = ((adv_ts >= scan_first_up_ts)
+                           & ((adv_ts - scan_first_up_ts) % self.scan_interval < self.scan_window)
+                           & (adv_ts <= self.end_time) & (layer > 0))
+            discovery_prob = layer[in_scan_win] * (1 - self.loss_rate)
+            remain_pdf = layer[in_scan_win] * self.loss_rate
+            remain_pdf[remain_pdf < 0.00001] = 0
+            layer[in_scan_win] = remain_pdf
+            for ts, prob in zip(adv_ts[in_scan_win].tolist(), discovery_prob.tolist()):
+                latency2pdf[ts] = latency2pdf.get(ts, 0) + prob
+            base_prob -= discovery_prob.sum()
 
-    def simulate_all(self, to_cdf=True):
-        if self.scan_interval <= self.adv_interval:
-            raise NotImplementedError(r"$T_a > T_s$ is under refining.")
-        if self.adv_interval <= self.scan_window:
-            self.simulate_all_ta_le_ts(to_cdf)
-        phase_projection_times = self.scan_interval // self.adv_interval
-        remain_cases = self.scan_interval % self.adv_interval
-        prob_accumulator = ProbabilitySummationAccumulator(self.max_advdelay)
+            # Drop the zero margins so that the layer only spans the positions still possible
+            nonzero = np.flatnonzero(layer)
+            if len(nonzero) == 0:
+                break
+            layer = np.convolve(layer[nonzero[0]:nonzero[-1] + 1], delay_pdf)
+            layer_start_ts += nonzero[0] + self.adv_interval
 
-        for _ in range(phase_projection_times):
-            prob_accumulator.next_layer()
-        adv_ts_delay_pdf = prob_accumulator.get_all_pdf()
+        if base_prob > 0:
+            latency2pdf[self.inf] = base_prob
+        return latency2pdf
+
+    @cached(ignore=('workers',))
+    def simulate_all(self, to_cdf=True, projection='convolution', workers=1):
+        """
+        projection selects how the Phase-Difference and Range-Entrance Projections are evaluated:
+        'convolution' folds them into FFT/cumulative-sum convolutions, 'loop' runs the reference nested loops.
+        workers > 1 (or None for all cores) spreads the phase offsets over a process pool; the result is identical
+        whatever the number of workers.
+        """
+        if projection not in ('convolution', 'loop'):
+            raise ValueError(f"Unknown projection engine {projection}.")
+        if self.scan_interval <= self.adv_interval or self.adv_interval <= self.scan_window:
+            # The Phase-Difference Projection needs a full advertising interval inside the scan interval and a single
+            # advertise event per scan window: enumerate every scan phase as a base case instead.
+            phase_projection_times = 0
+            phi_s_range = (0, self.scan_interval)
+        else:
+            phase_projection_times = self.scan_interval // self.adv_interval
+            phi_s_range = (0, self.adv_interval)
+        stage = type(self).__name__
+        with profiler.timer(f'{stage}.delay_layers'):
+            prob_accumulator = VectorizedSummationAccumulator(self.max_advdelay)
+            prob_accumulator.extend(phase_projection_times)
+            adv_ts_delay_pdf = prob_accumulator.get_all_pdf()
+
+        with profiler.timer(f'{stage}.phase_projection'):
+            phase_pdf, base_case_pdf = self.project_phases(projection, phi_s_range, phase_projection_times,
+                                                           adv_ts_delay_pdf, workers)
+            self.latency_pdf += phase_pdf
 
-        phi_s_range = (0, self.adv_interval)
+        with profiler.timer(f'{stage}.range_entrance'):
+            if projection == 'loop':
+                self.project_range_entrance_loop()
+            else:
+                self.latency_pdf += clipped_convolve(base_case_pdf,
+                                                     self.projection_kernel(phase_projection_times, adv_ts_delay_pdf),
+                                                     self.inf + 1)
+                self.latency_pdf[:] = box_filter(self.latency_pdf, self.adv_interval)
 
+        # Output process
+        prob_sum = sum(self.latency_pdf)
+        pdf = self.latency_pdf / prob_sum
+        if to_cdf:
+            cdf = np.cumsum(pdf)
+            cdf[-1] = 1.0
+            return cdf
+        return pdf
+
+    def simulate_distribution(self, projection='convolution', workers=1, dtype=np.float64):
+        """simulate_all as a LatencyDistribution, the timeouts of the inf bin forming its tail."""
+        return LatencyDistribution.from_dense(self.simulate_all(to_cdf=False, projection=projection, workers=workers),
+                                              self.inf, dtype)
+
+    def project_phases(self, projection, phi_s_range, phase_projection_times, adv_ts_delay_pdf, workers=1):
+        """
+        Run the per-phase part of the projection in chunks of PHASE_CHUNK_SIZE phase offsets and sum the partial
+        histograms in chunk order. Returns the pdf to add to latency_pdf and, for the convolution engine, the summed
+        base cases still to be projected.
+        """
+        chunk_ranges = [(start, min(start + PHASE_CHUNK_SIZE, phi_s_range[1]))
+                        for start in range(phi_s_range[0], phi_s_range[1], PHASE_CHUNK_SIZE)]
+        args = (repeat(projection), chunk_ranges, repeat(phase_projection_times), repeat(adv_ts_delay_pdf))
+        if workers == 1 or len(chunk_ranges) == 1:
+            partials = map(_project_phase_chunk, repeat(self), *args)
+            return self.reduce_phase_chunks(partials)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return self.reduce_phase_chunks(executor.map(_project_phase_chunk, repeat(self), *args))
+
+    def reduce_phase_chunks(self, partials):
+        phase_pdf = np.zeros(self.inf + 1)
+        base_case_pdf = np.zeros(self.inf + 1)
+        for chunk_phase_pdf, chunk_base_case_pdf in partials:
+            phase_pdf += chunk_phase_pdf
+            if chunk_base_case_pdf is not None:
+                base_case_pdf += chunk_base_case_pdf
+        return phase_pdf, base_case_pdf
+
+    def project_phase_chunk(self, projection, phi_s_range, phase_projection_times, adv_ts_delay_pdf):
+        """Partial histograms of the phase offsets in phi_s_range. Leaves latency_pdf untouched."""
+        if projection == 'loop':
+            latency_pdf = self.latency_pdf
+            self.latency_pdf = np.zeros(self.inf + 1)
+            try:
+                self.project_phases_loop(phi_s_range, phase_projection_times, adv_ts_delay_pdf)
+                return self.latency_pdf, None
+            finally:
+                self.latency_pdf = latency_pdf
+        return self.project_phases_convolution(phi_s_range, phase_projection_times, adv_ts_delay_pdf)
+
+    def project_phases_loop(self, phi_s_range, phase_projection_times, adv_ts_delay_pdf):
         for phi_s in range(*phi_s_range):
             # START Base-Case Simulation
             latencyxprob = np.asarray(list(self.simulate_once(0, phi_s).items()))
             for (latency, prob) in latencyxprob:
                 self.latency_pdf[int(latency)] += prob
             # END Base-Case Simulation
+            if phase_projection_times == 0:
+                continue
 
             base_adv_ts = 0
             adv_delay_max_range = 0
@@ -114,6 +244,7 @@ class BruteForceLossAdvdelaySimulator:
                     self.latency_pdf[min(int(latency) + adv_ts, self.inf)] += prob * delay_prob
             # END Phase-Difference Projection
 
+    def project_range_entrance_loop(self):
         phase_projection_latency_pdf = self.latency_pdf.copy()
 
         # START Range-Entrance Projection
@@ -123,24 +254,109 @@ class BruteForceLossAdvdelaySimulator:
                     self.latency_pdf[min(self.inf, latency + phi_s)] += prob
         # END Range-Entrance Projection
 
-        # Output process
-        prob_sum = sum(self.latency_pdf)
-        pdf = self.latency_pdf / prob_sum
-        if to_cdf:
-            cdf = np.cumsum(pdf)
-            cdf[-1] = 1.0
-            return cdf
-        return pdf
+    def project_phases_convolution(self, phi_s_range, phase_projection_times, adv_ts_delay_pdf):
+        """
+        Same result as project_phases_loop, split in two parts. All but the last projection shift every base case by
+        the same delay pdfs, so they act as one kernel (see projection_kernel) on the sum of the base cases, which is
+        returned; only the last projection, truncated at the end of the scan interval, depends on phi_s and is
+        accumulated per phase into the returned pdf.
+        """
+        base_case_pdf = np.zeros(self.inf + 1)
+        last_projection_pdf = np.zeros(self.inf + 1)
+        for phi_s in range(*phi_s_range):
+            latencyxprob = np.asarray(list(self.simulate_once(0, phi_s).items()))
+            latencies, probs = latencyxprob[:, 0].astype(np.int64), latencyxprob[:, 1]
+            base_case_pdf += np.bincount(latencies, weights=probs, minlength=self.inf + 1)
+
+            # special check of last projection: only delays keeping the scan window inside the scan interval
+            last_adv_ts = phase_projection_times * self.adv_interval
+            delay_count = min(phase_projection_times * self.max_advdelay, self.scan_interval - last_adv_ts - phi_s) + 1
+            if phase_projection_times > 0 and delay_count > 0:
+                delay_pdf = adv_ts_delay_pdf[phase_projection_times - 1][:delay_count]
+                targets = np.minimum(latencies[:, None] + last_adv_ts + np.arange(delay_count)[None, :], self.inf)
+                last_projection_pdf += np.bincount(targets.ravel(),
+                                                   weights=(probs[:, None] * delay_pdf[None, :]).ravel(),
+                                                   minlength=self.inf + 1)
+        return last_projection_pdf, base_case_pdf
+
+    def projection_kernel(self, phase_projection_times, adv_ts_delay_pdf):
+        """Identity plus the delay pdfs of projections 1 .. phase_projection_times - 1 at their base offsets."""
+        kernel = np.zeros(max(phase_projection_times - 1, 0) * (self.adv_interval + self.max_advdelay) + 1)
+        kernel[0] = 1
+        for projection_time in range(1, phase_projection_times):
+            base_adv_ts = projection_time * self.adv_interval
+            delay_pdf = adv_ts_delay_pdf[projection_time - 1]
+            kernel[base_adv_ts:base_adv_ts + len(delay_pdf)] += delay_pdf
+        return kernel
+
+
+class DynamicProjectionLossAdvdelaySimulator(BruteForceLossAdvdelaySimulator):
+    """
+    BruteForceLossAdvdelaySimulator whose base cases reuse work across phase offsets.
+    Layers are only ever reduced at positions falling inside a scan window, so between two events that are actually
+    scanned the chain of layers is a plain convolution with the advDelay pdf of the events in between. The unreduced
+    layers are therefore built once in delay_layers and shared by every phi_s: a base case starts from the shared
+    layer of its first scanned event and jumps from one scanned event to the next with a single convolution, instead
+    of building a layer per advertising event. The scanned event of each window follows from arithmetic on the window
+    position, and the positions inside a window are reduced as one slice. Results match the brute-force class up to
+    floating-point rounding.
+    """
+    __slots__ = ['delay_layers']
+
+    def __init__(self, adv_interval, scan_interval, scan_window, end_time, loss_rate=0, max_advdelay=10):
+        super().__init__(adv_interval, scan_interval, scan_window, end_time, loss_rate, max_advdelay)
+        self.delay_layers = VectorizedSummationAccumulator(max_advdelay)
+
+    def shared_layer(self, draw_count):
+        """Pdf of the summed advDelay of draw_count events."""
+        missing = draw_count - self.delay_layers.layer_count
+        if missing > 0:
+            self.delay_layers.extend(missing)
+        return self.delay_layers.layers[draw_count - 1]
 
+    def simulate_once(self, first_adv_ts, first_scan_down_ts):
+        if self.adv_interval <= self.scan_window:
+            return self.simulate_once_ta_le_ds(first_adv_ts, first_scan_down_ts)
+        # Event e is advertised at first_adv_ts + e * adv_interval plus the advDelay of e + 1 draws
+        event_span = self.adv_interval + self.max_advdelay
+        scan_cur_up_ts = first_scan_down_ts - self.scan_window
+        adv_evt = 0
+        layer, layer_evt = None, -1
+        base_prob = 1
+        latency2pdf = dict()
+
+        while scan_cur_up_ts <= self.end_time:
+            # Skip the events whose positions all fall before the current scan window
+            reach = scan_cur_up_ts - first_adv_ts - self.max_advdelay
+            if adv_evt * event_span < reach:
+                adv_evt = -(-reach // event_span)
+            adv_cur_base_ts = first_adv_ts + adv_evt * self.adv_interval
+            scan_cur_down_ts = scan_cur_up_ts + self.scan_window
+            low = max(adv_cur_base_ts, scan_cur_up_ts)
+            high = min(adv_cur_base_ts + (adv_evt + 1) * self.max_advdelay + 1, scan_cur_down_ts, self.end_time + 1)
+            if adv_cur_base_ts < scan_cur_down_ts and low < high:
+                if layer is None:
+                    layer = self.shared_layer(adv_evt + 1).copy()
+                elif adv_evt > layer_evt:
+                    layer = np.convolve(layer, self.shared_layer(adv_evt - layer_evt))
+                layer_evt = adv_evt
+
+                window_pdf = layer[low - adv_cur_base_ts:high - adv_cur_base_ts]
+                present = window_pdf > 0
+                discovery_prob = window_pdf[present] * (1 - self.loss_rate)
+                remain_pdf = window_pdf[present] * self.loss_rate
+                remain_pdf[remain_pdf < 0.00001] = 0
+                window_pdf[present] = remain_pdf
 
-# TODO: Faster Projection
-# class DynamicProjectionLossAdvdelaySimulator(BruteForceLossAdvdelaySimulator):
-#     __slots__ = super.__slots__ + []
-#     def __init__(self, adv_interval, scan_interval, scan_window, end_time, loss_rate=0, max_advdelay=10):
-#         super().__init__(adv_interval, scan_interval, scan_window, end_time, loss_rate, max_advdelay)
-#         self.basecase_range()
+                latency2pdf.update(zip(np.arange(low, high)[present].tolist(), discovery_prob.tolist()))
+                base_prob -= discovery_prob.sum()
+
+            scan_cur_up_ts += self.scan_interval
+
+        if base_prob > 0:
+            latency2pdf[self.inf] = base_prob
+        return latency2pdf
 
-        
 
 if __name__ == '__main__':
     blender = BruteForceLossAdvdelaySimulator(adv_interval=1860,
@@ -0,0 +1,189 @@
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from algo.distribution import LatencyDistribution
+from simulator.coverage import AlternationBroadcastConfig
+from simulator.determined import DynamicProjectionLossAdvdelaySimulator
+from simulator.sweep import cover_count_histograms
+from utils import Log
+
+# Candidates evaluated per worker between two dominance prunings.
+OPTIMIZER_BATCH_PER_WORKER = 4
+
+
+def adv_duty(advertising):
+    """Advertise events per millisecond of an advertising interval or an ABP root sequence."""
+    if isinstance(advertising, tuple):
+        return len(advertising) / sum(advertising)
+    return 1 / advertising
+
+
+def coverage_histograms(advertising, scan_interval, scan_window, end_time):
+    """Per ABP start index: event timestamps, cover-count histograms and Range-Entrance width."""
+    root_seq = list(advertising) if isinstance(advertising, tuple) else [advertising]
+    schedule = AlternationBroadcastConfig(root_seq).schedule()
+    result = []
+    for start_index in range(len(schedule)):
+        event_ts = schedule.timestamps(start_index, end_time)
+        result.append((event_ts, cover_count_histograms(event_ts, scan_interval, scan_window), schedule[start_index]))
+    return result
+
+
+def coverage_discovery_rate(histograms, scan_interval, end_time, fail_rate, target_latency):
+    """P(latency <= target_latency) of CLIFABL at loss ratio fail_rate, from coverage_histograms."""
+    starts, widths, weights = [], [], []
+    for event_ts, hist, width in histograms:
+        discovery_prob = (1 - fail_rate) / scan_interval * (hist @ fail_rate ** np.arange(hist.shape[1]))
+        starts.append(np.append(event_ts, end_time))
+        weights.append(np.append(discovery_prob, 1 - discovery_prob.sum()))
+        widths.append(np.full(len(event_ts) + 1, width))
+    distribution = LatencyDistribution.from_boxes(np.concatenate(starts), np.concatenate(widths),
+                                                  np.concatenate(weights), end_time)
+    return float(distribution.cdf(target_latency))
+
+
+def _evaluate(optimizer, candidate):
+    return optimizer.evaluate(candidate)
+
+
+class SLAOptimizer:
+    """
+    Cheapest configurations meeting "the percentile-quantile of the discovery latency is at most target_latency
+    at loss_rate (%)", i.e. P(latency <= target_latency) >= percentile.
+    Candidates are (advertising, scan_interval, scan_window) triples, advertising being an advertising interval or a
+    tuple ABP root sequence, and cost two duty cycles: advertise events per ms and scan_window / scan_interval.
+    Evaluation goes from cheap to exact, pruning only candidates that provably cannot join the Pareto front:
+    1. a union bound, every event discovering at most a scan_window / scan_interval share of the phases with
+       probability 1 - loss, so the discovery rate is at most the mean over the start index and entrance phase of
+       min(1, events so far * scan_window / scan_interval * (1 - loss));
+    2. dominance: candidates are visited by increasing advertising then scanning duty, and a candidate costing at
+       least as much on both as a feasible one already found cannot join the Pareto front;
+    3. the exact engine, 'coverage' (CLIFABL) or 'determined' (DynamicProjectionLossAdvdelaySimulator, with
+       advDelay, single advertising intervals only), over a process pool.
+    Coverage states are memoized per (advertising, scan_interval, scan_window) and evaluations per candidate, so
+    later optimize calls on the same SLA only evaluate new candidates.
+    """
+    def __init__(self, target_latency, percentile, loss_rate=0, engine='coverage', max_advdelay=10):
+        if engine not in ('coverage', 'determined'):
+            raise ValueError(f"Unknown optimizer engine {engine}.")
+        if not 0 < percentile <= 1:
+            raise ValueError("Percentile must be in (0, 1].")
+        self.target_latency = target_latency
+        self.percentile = percentile
+        self.loss_rate = loss_rate
+        self.engine = engine
+        self.max_advdelay = max_advdelay
+        # Latencies up to target_latency must stay out of the tail lumped at the horizon
+        self.end_time = target_latency + 1
+        self.histogram_memo = dict()
+        self.evaluation_memo = dict()
+
+    def __getstate__(self):
+        # Workers evaluate single candidates: leave the memos behind
+        state = dict(self.__dict__)
+        state['histogram_memo'], state['evaluation_memo'] = dict(), dict()
+        return state
+
+    @staticmethod
+    def candidates(advertisings, scan_intervals, scan_windows):
+        return [(a, s, w) for a, s, w in itertools.product(advertisings, scan_intervals, scan_windows) if w <= s]
+
+    @staticmethod
+    def cost(candidate):
+        advertising, scan_interval, scan_window = candidate
+        return adv_duty(advertising), scan_window / scan_interval
+
+    def union_bound(self, candidate):
+        advertising, scan_interval, scan_window = candidate
+        root_seq = list(advertising) if isinstance(advertising, tuple) else [advertising]
+        schedule = AlternationBroadcastConfig(root_seq).schedule()
+        per_event = scan_window / scan_interval * (1 - self.loss_rate / 100)
+        bound = 0.0
+        for start_index in range(len(schedule)):
+            # Start index i is entered with probability r_i / itv_sum, at a phase uniform over its interval r_i;
+            # advDelay only postpones the events counted here
+            width = schedule[start_index]
+            event_ts = schedule.timestamps(start_index, self.target_latency)
+            events = np.searchsorted(event_ts, self.target_latency - np.arange(width), side='right')
+            bound += width / schedule.itv_sum * np.minimum(1, events * per_event).mean()
+        return float(bound)
+
+    def histograms(self, candidate):
+        if candidate not in self.histogram_memo:
+            self.histogram_memo[candidate] = coverage_histograms(*candidate, self.end_time)
+        return self.histogram_memo[candidate]
+
+    def evaluate(self, candidate):
+        """P(latency <= target_latency) of candidate under the exact engine."""
+        advertising, scan_interval, scan_window = candidate
+        if self.engine == 'coverage':
+            return coverage_discovery_rate(self.histograms(candidate), scan_interval, self.end_time,
+                                           self.loss_rate / 100, self.target_latency)
+        if isinstance(advertising, tuple):
+            raise NotImplementedError("The determined engine does not support ABP root sequences.")
+        simulator = DynamicProjectionLossAdvdelaySimulator(advertising, scan_interval, scan_window,
+                                                           self.target_latency, self.loss_rate, self.max_advdelay)
+        return float(simulator.simulate_all(to_cdf=True)[self.target_latency])
+
+    @staticmethod
+    def dominated(cost, front):
+        return any(f[0] <= cost[0] and f[1] <= cost[1] for f in front)
+
+    def optimize(self, candidates, workers=1):
+        """
+        Pareto front of the feasible candidates over (advertising duty, scanning duty), as dicts sorted by
+        advertising duty. The 'determined' engine rejects ABP root sequences before any screening.
+        """
+        candidates = sorted(set(candidates), key=self.cost)
+        if self.engine == 'determined':
+            abp = [c for c in candidates if isinstance(c[0], tuple)]
+            if abp:
+                raise ValueError(f"The determined engine does not support ABP root sequences ({len(abp)} "
+                                 f"candidates, e.g. {abp[0]}). Use the coverage engine for them.")
+        feasible = dict()
+        pruned = {'union bound': 0, 'dominance': 0}
+        pending = deque()
+        for candidate in candidates:
+            if candidate in self.evaluation_memo:
+                if self.evaluation_memo[candidate] >= self.percentile:
+                    feasible[candidate] = self.evaluation_memo[candidate]
+                continue
+            # The bound can be tight: leave room for rounding below the exact rate
+            if self.union_bound(candidate) < self.percentile - 1e-9:
+                pruned['union bound'] += 1
+                continue
+            pending.append(candidate)
+
+        batch_size = OPTIMIZER_BATCH_PER_WORKER * (workers or 1)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+        try:
+            while pending:
+                front = [self.cost(c) for c in feasible]
+                batch = []
+                while pending and len(batch) < batch_size:
+                    candidate = pending.popleft()
+                    if self.dominated(self.cost(candidate), front):
+                        pruned['dominance'] += 1
+                        continue
+                    batch.append(candidate)
+                rates = map(self.evaluate, batch) if executor is None else \
+                    executor.map(_evaluate, itertools.repeat(self), batch)
+                for candidate, rate in zip(batch, rates):
+                    self.evaluation_memo[candidate] = rate
+                    if rate >= self.percentile:
+                        feasible[candidate] = rate
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        Log.D('SLAOptimizer', '%d candidates, pruned %s, %d feasible', len(candidates), pruned, len(feasible))
+
+        front = []
+        for candidate in sorted(feasible, key=self.cost):
+            cost = self.cost(candidate)
+            if not self.dominated(cost, [self.cost(f['config']) for f in front]):
+                front.append({'config': candidate, 'adv_duty': cost[0], 'scan_duty': cost[1],
+                              'discovery_rate': feasible[candidate]})
+        return front
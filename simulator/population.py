@@ -0,0 +1,81 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from simulator.coverage import AlternationBroadcastConfig
+from simulator.sampler import TIMEOUT_NOTIFIER, abp_batch_latency, ble_batch_latency
+
+
+class OfflineFindingPopulationSampler:
+    """
+    Monte Carlo of a lost tag in an offline-finding network.
+    Finders pass by the tag as a Poisson process with mean gap encounter_gap (ms). Each finder draws its scan
+    settings from finder_profiles, a list of (scan_interval, scan_window, weight) or
+    (scan_interval, scan_window, weight, loss_rate), and stays in range for a duration drawn from encounter_duration,
+    either a mean (ms) of an exponential distribution or a callable (rng, size) -> durations.
+    The tag advertises either every adv_interval (with advDelay up to max_advdelay) or following abp_config, with an
+    independent phase in every encounter. The time-to-first-report of a tag is the earliest discovery over all of its
+    encounters before horizon, and horizon + TIMEOUT_NOTIFIER if no finder discovers it.
+    """
+    def __init__(self, finder_profiles: List[Tuple], encounter_gap, encounter_duration, horizon,
+                 adv_interval=None, abp_config: AlternationBroadcastConfig = None, loss_rate=0, max_advdelay=10):
+        if (adv_interval is None) == (abp_config is None):
+            raise ValueError("Exactly one of adv_interval and abp_config must be provided.")
+        if not finder_profiles:
+            raise ValueError("At least one finder profile must be provided.")
+        if encounter_gap <= 0 or horizon <= 0:
+            raise ValueError("Encounter gap and horizon must be positive.")
+        profiles = np.asarray([tuple(p) + (loss_rate,) * (4 - len(p)) for p in finder_profiles], dtype=float)
+        if np.any(profiles[:, 0] < profiles[:, 1]):
+            raise ValueError('Scan Interval is unreasonably set to less than Scan Window.')
+        self.scan_intervals = profiles[:, 0].astype(np.int64)
+        self.scan_windows = profiles[:, 1].astype(np.int64)
+        self.profile_weights = profiles[:, 2] / profiles[:, 2].sum()
+        self.loss_rates = profiles[:, 3]
+        self.encounter_gap = encounter_gap
+        self.encounter_duration = encounter_duration
+        self.horizon = horizon
+        self.adv_interval = adv_interval
+        self.abp_config = abp_config
+        self.max_advdelay = max_advdelay
+
+    def draw_durations(self, rng, size):
+        if callable(self.encounter_duration):
+            return np.asarray(self.encounter_duration(rng, size)).astype(np.int64)
+        return rng.exponential(self.encounter_duration, size=size).astype(np.int64)
+
+    def encounter_latency(self, rng, profile, duration):
+        """Discovery latency of one encounter per entry of profile/duration; timeouts exceed their duration."""
+        n = len(profile)
+        if self.abp_config is not None:
+            return abp_batch_latency(rng, n, self.abp_config.schedule(), self.scan_intervals[profile],
+                                     self.scan_windows[profile], duration, self.loss_rates[profile])
+        return ble_batch_latency(rng, n, self.adv_interval, self.scan_intervals[profile], self.scan_windows[profile],
+                                 duration, self.loss_rates[profile], self.max_advdelay)
+
+    def simulate_batch(self, n, seed=None):
+        """
+        Time-to-first-report of n tags. Every round draws the next encounter of all tags still pending at once and
+        retires a tag once its next encounter starts after the horizon or after its best report so far.
+        """
+        rng = np.random.default_rng(seed)
+        reports = np.full(n, self.horizon + TIMEOUT_NOTIFIER, dtype=np.int64)
+        tag_idx = np.arange(n)
+        encounter_start = np.zeros(n)
+        while tag_idx.size > 0:
+            encounter_start = encounter_start + rng.exponential(self.encounter_gap, size=tag_idx.size)
+            pending = encounter_start < np.minimum(reports[tag_idx], self.horizon)
+            tag_idx, encounter_start = tag_idx[pending], encounter_start[pending]
+            if tag_idx.size == 0:
+                break
+            profile = rng.choice(len(self.profile_weights), size=tag_idx.size, p=self.profile_weights)
+            duration = self.draw_durations(rng, tag_idx.size)
+            latency = self.encounter_latency(rng, profile, duration)
+            found = latency <= duration
+            report = np.ceil(encounter_start[found]).astype(np.int64) + latency[found]
+            reports[tag_idx[found]] = np.minimum(reports[tag_idx[found]], report)
+        reports[reports > self.horizon] = self.horizon + TIMEOUT_NOTIFIER
+        return reports
+
+    def get_report_rate(self, target_time, n=10000, seed=None):
+        return np.count_nonzero(self.simulate_batch(n, seed=seed) <= target_time) / n
@@ -1,12 +1,152 @@
 import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from algo.distribution import LatencyDistribution
 from simulator.coverage import AlternationBroadcastConfig
 from utils import Log
+from utils.cache import ResultCache, engine_params, get_default_cache, normalize_param
+from utils.eval import BINOMIAL_INTERVALS
 import numpy as np
-import os
 
 
 TIMEOUT_NOTIFIER = 1
-LOG_ROOT = os.path.join('C:/code', 'traces')
+# Trials per independent RNG stream. Fixed so that results never depend on the number of workers, and small enough
+# that 10^6 trials give every worker of a 64-core pool several chunks.
+PARALLEL_CHUNK_SIZE = 1 << 12
+
+
+def _simulate_chunk(simulator, n, seed):
+    return simulator.simulate_batch(n, seed=seed)
+
+
+def _compact(mask, *values):
+    """Keep the masked trials of every per-trial array; scalar parameters are shared and pass through."""
+    return tuple(v[mask] if isinstance(v, np.ndarray) and v.ndim > 0 else v for v in values)
+
+
+def ble_batch_latency(rng, n, adv_interval, scan_interval, scan_window, end_time, fail_rate, max_advdelay,
+                      adv_phase=None, scan_phase=None, losses=None):
+    """
+    Vectorized counterpart of PureBleSimulator.simulate_once over a trial axis.
+    Each step draws the next advertising event of every pending trial at once; a trial leaves the
+    pending set as soon as one of its events is received or its advertising sequence passes end_time.
+    Every parameter but max_advdelay may be a scalar or an array of length n holding per-trial values.
+    adv_phase (first advertising event) and scan_phase (phi_s) replace the uniform draws when given, and losses,
+    an int array of length n, receives the number of in-window events lost by every trial.
+    """
+    latencies = np.broadcast_to(np.asarray(end_time, dtype=np.int64) + TIMEOUT_NOTIFIER, (n,)).copy()
+    trial_idx = np.arange(n)
+    adv_ts = rng.integers(0, adv_interval, size=n) if adv_phase is None else np.asarray(adv_phase, dtype=np.int64)
+    # Scan sequence starts at -phi_s; a window covers [down - scan_window, down) for down = -phi_s + k * T_s, k >= 1
+    scan_origin = -(rng.integers(0, scan_interval, size=n) if scan_phase is None
+                    else np.asarray(scan_phase, dtype=np.int64))
+    while trial_idx.size > 0:
+        offset = adv_ts - scan_origin
+        pos_in_interval = offset % scan_interval
+        # The scan window holding adv_ts only exists if the previous window closed before end_time
+        hit = (pos_in_interval >= scan_interval - scan_window) & (adv_ts - pos_in_interval < end_time)
+        if np.any(fail_rate):
+            received = fail_rate / 100 < rng.random(size=trial_idx.size)
+            if losses is not None:
+                losses[trial_idx[hit & ~received]] += 1
+            hit &= received
+        latencies[trial_idx[hit]] = adv_ts[hit]
+
+        trial_idx, adv_ts, scan_origin, adv_interval, scan_interval, scan_window, end_time, fail_rate = \
+            _compact(~hit, trial_idx, adv_ts, scan_origin, adv_interval, scan_interval, scan_window, end_time, fail_rate)
+        adv_ts = adv_ts + adv_interval
+        if max_advdelay > 0:
+            adv_ts += rng.integers(0, max_advdelay + 1, size=trial_idx.size)
+        trial_idx, adv_ts, scan_origin, adv_interval, scan_interval, scan_window, end_time, fail_rate = \
+            _compact(adv_ts <= end_time, trial_idx, adv_ts, scan_origin, adv_interval, scan_interval, scan_window,
+                     end_time, fail_rate)
+    return latencies
+
+
+def ble_skipping_latency(rng, n, adv_interval, scan_interval, scan_window, end_time, fail_rate, max_advdelay):
+    """
+    Event-skipping variant of ble_batch_latency, vectorized over trials.
+    Instead of walking every advertising event, each step either tests reception of an event inside a scan window or
+    jumps over events that cannot reach the next window: with advDelay bounded by max_advdelay, the next
+    (gap - 1) // (adv_interval + max_advdelay) events surely land before it, and the sum of their delays is drawn at
+    once from a multinomial over the delay values. The cost of a trial thus grows with the scan windows it visits
+    rather than with the advertising events before end_time.
+    """
+    latencies = np.full(n, end_time + TIMEOUT_NOTIFIER, dtype=np.int64)
+    trial_idx = np.arange(n)
+    adv_ts = rng.integers(0, adv_interval, size=n)
+    scan_origin = -rng.integers(0, scan_interval, size=n)
+    delay_values = np.arange(max_advdelay + 1)
+    delay_pvals = np.full(max_advdelay + 1, 1 / (max_advdelay + 1))
+    while trial_idx.size > 0:
+        pos_in_interval = (adv_ts - scan_origin) % scan_interval
+        # The scan window of this scan interval only exists if the previous window closed before end_time
+        exists = adv_ts - pos_in_interval < end_time
+        trial_idx, adv_ts, scan_origin, pos_in_interval = \
+            _compact(exists, trial_idx, adv_ts, scan_origin, pos_in_interval)
+        in_window = pos_in_interval >= scan_interval - scan_window
+        received = in_window
+        if fail_rate > 0:
+            received = in_window & (fail_rate / 100 < rng.random(size=trial_idx.size))
+        latencies[trial_idx[received]] = adv_ts[received]
+
+        trial_idx, adv_ts, scan_origin, pos_in_interval, in_window = \
+            _compact(~received, trial_idx, adv_ts, scan_origin, pos_in_interval, in_window)
+        gap = scan_interval - scan_window - pos_in_interval
+        if max_advdelay == 0:
+            steps = np.where(in_window, 1, (gap + adv_interval - 1) // adv_interval)
+            adv_ts = adv_ts + steps * adv_interval
+        else:
+            steps = np.where(in_window, 1, np.maximum(1, (gap - 1) // (adv_interval + max_advdelay)))
+            delays = rng.integers(0, max_advdelay + 1, size=trial_idx.size)
+            jump = steps > 1
+            if np.any(jump):
+                delays[jump] = rng.multinomial(steps[jump], delay_pvals) @ delay_values
+            adv_ts = adv_ts + steps * adv_interval + delays
+        trial_idx, adv_ts, scan_origin = _compact(adv_ts <= end_time, trial_idx, adv_ts, scan_origin)
+    return latencies
+
+
+def abp_batch_latency(rng, n, schedule, scan_interval, scan_window, end_time, fail_rate,
+                      start_value=None, scan_phase=None, losses=None):
+    """
+    Vectorized counterpart of AlternationBroadcastSampler.simulate_once over a trial axis, driven by an immutable
+    AlternationBroadcastSchedule. Start phases come from a searchsorted over the interval prefix sums and every step
+    advances the pending trials to their next advertising event at once.
+    scan_interval, scan_window, end_time and fail_rate may be scalars or arrays of length n holding per-trial values.
+    start_value (the rand_start() draw in [0, itv_sum]) and scan_phase (phi_s) replace the uniform draws when given,
+    and losses, an int array of length n, receives the number of in-window events lost by every trial.
+    """
+    seq_len = len(schedule)
+    latencies = np.broadcast_to(np.asarray(end_time, dtype=np.int64) + TIMEOUT_NOTIFIER, (n,)).copy()
+    trial_idx = np.arange(n)
+    start_index, adv_ts = schedule.rand_start(rng, n) if start_value is None else schedule.start_at(start_value)
+    # Scan windows cover [scan_up, scan_up + scan_window) for scan_up = phi_s - scan_window + k * T_s, k >= 0
+    scan_up = (rng.integers(0, np.asarray(scan_interval) + 1, size=n) if scan_phase is None
+               else np.asarray(scan_phase, dtype=np.int64)) - scan_window
+    event_index = 0
+    while True:
+        trial_idx, adv_ts, start_index, scan_up, scan_interval, scan_window, end_time, fail_rate = \
+            _compact(adv_ts <= end_time, trial_idx, adv_ts, start_index, scan_up, scan_interval, scan_window,
+                     end_time, fail_rate)
+        if trial_idx.size == 0:
+            break
+        offset = adv_ts - scan_up
+        hit = (offset >= 0) & (offset % scan_interval < scan_window)
+        if np.any(fail_rate):
+            received = fail_rate / 100 < rng.random(size=trial_idx.size)
+            if losses is not None:
+                losses[trial_idx[hit & ~received]] += 1
+            hit &= received
+        latencies[trial_idx[hit]] = adv_ts[hit]
+
+        trial_idx, adv_ts, start_index, scan_up, scan_interval, scan_window, end_time, fail_rate = \
+            _compact(~hit, trial_idx, adv_ts, start_index, scan_up, scan_interval, scan_window, end_time, fail_rate)
+        adv_ts = adv_ts + schedule.step_table[start_index, event_index % seq_len]
+        event_index += 1
+    return latencies
+
 
 class AbstractSimulator:
     def __init__(self, scan_interval, scan_window, end_time, fail_rate, max_advdelay):
@@ -26,33 +166,186 @@ class AbstractSimulator:
     def simulate_once(self):
         raise NotImplementedError
 
+    def simulate_batch(self, n, seed=None):
+        """
+        Run n independent trials and return their latencies as an int64 array.
+        seed accepts anything np.random.default_rng does; simulators without a native batch engine fall back to
+        simulate_once, which draws from the global random state and therefore cannot be seeded.
+        """
+        if seed is not None:
+            raise NotImplementedError(f"{type(self).__name__} does not support seeded sampling.")
+        return np.array([self.simulate_once() for _ in range(n)], dtype=np.int64)
+
+    def simulate_with_phases(self, rng, n, phase_u, fail_rate, losses):
+        """
+        Importance-sampling hook: run n trials whose advertising and scanning phases are given as the two columns of
+        phase_u, uniform variates in [0, 1), under loss rate fail_rate (%), counting lost in-window events into losses.
+        """
+        raise NotImplementedError
+
+    def estimate_tail_probability(self, threshold, n=100000, biased_fail_rate=None, phase_bins=16, pilot_n=10000,
+                                  defensive_ratio=0.1, seed=None):
+        """
+        Importance-sampled estimate of P(latency > threshold) with its standard error.
+        Loss draws are taken at a biased loss rate and reweighted by the likelihood ratio of the lost and received
+        in-window events. Phases are drawn from a phase_bins x phase_bins histogram over the (advertising, scanning)
+        phase square, mixed with defensive_ratio of the uniform distribution so that no phase goes unsampled.
+        Unless biased_fail_rate (%) is given, both proposals are fitted by one cross-entropy step on a pilot run of
+        pilot_n trials taken halfway between the loss rate and 100%.
+        Returns (probability, standard error).
+        """
+        # The likelihood ratio divides by both the biased loss and reception probabilities
+        if biased_fail_rate is not None and biased_fail_rate != self.fail_rate and not 0 < biased_fail_rate < 100:
+            raise ValueError("Invalid biased_fail_rate provided. biased_fail_rate must lie strictly between 0 and 100 "
+                             "unless it equals the loss rate.")
+        rng = np.random.default_rng(seed)
+        bin_count = phase_bins * phase_bins
+        uniform = np.full(bin_count, 1 / bin_count)
+        loss_biased = 0 < self.fail_rate < 100
+        pilot_fail_rate = biased_fail_rate
+        if pilot_fail_rate is None:
+            pilot_fail_rate = self.fail_rate + (100 - self.fail_rate) / 2 if loss_biased else self.fail_rate
+        weights, latencies, losses, bins = self._weighted_run(rng, pilot_n, pilot_fail_rate, uniform)
+        tail_weights = weights * (latencies > threshold)
+        proposal = uniform
+        if tail_weights.sum() > 0:
+            tail_mass = np.bincount(bins, weights=tail_weights, minlength=bin_count)
+            proposal = defensive_ratio * uniform + (1 - defensive_ratio) * tail_mass / tail_mass.sum()
+            if biased_fail_rate is None and loss_biased:
+                # Cross-entropy update: the loss rate observed among the (reweighted) tail trials
+                received = latencies != self.end_time + TIMEOUT_NOTIFIER
+                in_window = np.sum(tail_weights * (losses + received))
+                if in_window > 0:
+                    pilot_fail_rate = min(99.0, max(self.fail_rate, 100 * np.sum(tail_weights * losses) / in_window))
+        weights, latencies, _, _ = self._weighted_run(rng, n, pilot_fail_rate, proposal)
+        values = weights * (latencies > threshold)
+        Log.D('Tail Probability', lambda: f'Effective sample size {values.sum() ** 2 / max(np.sum(values ** 2), 1e-300):.1f}.')
+        return float(values.mean()), float(values.std(ddof=1) / np.sqrt(n))
+
+    def _weighted_run(self, rng, n, biased_fail_rate, proposal):
+        phase_bins = int(round(np.sqrt(len(proposal))))
+        bins = rng.choice(len(proposal), size=n, p=proposal)
+        phase_u = (np.stack(np.divmod(bins, phase_bins), axis=1) + rng.random((n, 2))) / phase_bins
+        losses = np.zeros(n, dtype=np.int64)
+        latencies = self.simulate_with_phases(rng, n, phase_u, biased_fail_rate, losses)
+        weights = 1 / (len(proposal) * proposal[bins])
+        if biased_fail_rate != self.fail_rate:
+            fail, biased_fail = self.fail_rate / 100, biased_fail_rate / 100
+            received = latencies != self.end_time + TIMEOUT_NOTIFIER
+            weights *= (fail / biased_fail) ** losses * np.where(received, (1 - fail) / (1 - biased_fail), 1.0)
+        return weights, latencies, losses, bins
+
+    def simulate_parallel(self, n, seed=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        """
+        Run n trials over a process pool.
+        Trials are split into chunks of chunk_size, each driven by its own np.random.Generator spawned from seed, and
+        merged in chunk order, so a given seed yields the same latencies whatever the number of workers.
+        """
+        if n <= 0:
+            raise ValueError("Invalid n provided. n must be larger than zero.")
+        chunk_sizes = [chunk_size] * (n // chunk_size)
+        if n % chunk_size:
+            chunk_sizes.append(n % chunk_size)
+        chunk_seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+        if workers == 1 or len(chunk_sizes) == 1:
+            return np.concatenate(list(map(_simulate_chunk, repeat(self), chunk_sizes, chunk_seeds)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return np.concatenate(list(executor.map(_simulate_chunk, repeat(self), chunk_sizes, chunk_seeds)))
+
     def get_discover_rate_n_times(self, target_time, n=10000):
         if n <= 0:
             raise ValueError("Invalid n provided. n must be larger than zero.")
         if target_time > self.end_time:
             Log.W('Discover Rate', 'Target_time larger than provided maximum simulation time.')
             return 1.0
-        discover_count = 0
-        for _ in range(n):
-            if self.simulate_once() <= target_time:
-                discover_count += 1
+        discover_count = np.count_nonzero(self.simulate_batch(n) <= target_time)
         return discover_count / n
 
+    def get_discover_rate_n_times_parallel(self, target_time, n=10000, seed=None, workers=None):
+        if n <= 0:
+            raise ValueError("Invalid n provided. n must be larger than zero.")
+        if target_time > self.end_time:
+            Log.W('Discover Rate', 'Target_time larger than provided maximum simulation time.')
+            return 1.0
+        discover_count = np.count_nonzero(self.simulate_parallel(n, seed=seed, workers=workers) <= target_time)
+        return discover_count / n
+
+    def get_discover_rate_adaptive(self, target_time, ci_width=None, rel_error=None, threshold=None, confidence=0.95,
+                                   method='wilson', batch_size=1000, max_n=1000000, seed=None):
+        """
+        Estimate P(latency <= target_time) in batches of batch_size trials, stopping as soon as the confidence interval
+        is narrower than ci_width, its half-width is within rel_error of the estimate, or it lies entirely on one
+        side of threshold (e.g. 0.95 for an SLA check). Sampling also stops after max_n trials.
+        method selects the interval: 'wilson' or 'clopper-pearson'.
+        Returns (rate, trial count, (low, high)).
+        """
+        if ci_width is None and rel_error is None and threshold is None:
+            raise ValueError("At least one of ci_width, rel_error and threshold must be provided.")
+        if method not in BINOMIAL_INTERVALS:
+            raise ValueError(f"Unknown interval method {method}. Expected one of {list(BINOMIAL_INTERVALS)}.")
+        if batch_size <= 0:
+            raise ValueError("Invalid batch_size provided. batch_size must be larger than zero.")
+        if max_n <= 0:
+            raise ValueError("Invalid max_n provided. max_n must be larger than zero.")
+        if target_time > self.end_time:
+            Log.W('Discover Rate', 'Target_time larger than provided maximum simulation time.')
+            return 1.0, 0, (1.0, 1.0)
+        interval = BINOMIAL_INTERVALS[method]
+        seed_seq = np.random.SeedSequence(seed)
+        discover_count, n = 0, 0
+        while n < max_n:
+            batch_n = min(batch_size, max_n - n)
+            discover_count += int(np.count_nonzero(self.simulate_batch(batch_n, seed=seed_seq.spawn(1)[0]) <= target_time))
+            n += batch_n
+            rate = discover_count / n
+            low, high = interval(discover_count, n, confidence)
+            if ci_width is not None and high - low <= ci_width:
+                break
+            if rel_error is not None and rate > 0 and (high - low) / 2 <= rel_error * rate:
+                break
+            if threshold is not None and (low > threshold or high < threshold):
+                break
+        Log.D('Discover Rate', 'Adaptive estimation stopped after %d trials.', n)
+        return discover_count / n, n, (low, high)
+
     def to_identifier_string(self):
         return 'W%d_T%d_F%d_R%d_E%d' % \
                (self.scan_window, self.scan_interval, self.fail_rate, self.max_advdelay, self.end_time)
 
-    def get_latency_n_times(self, n, to_file, cover_file, file_prefix):
-        file_name = file_prefix + self.to_identifier_string() + ('_%d.npy' % n)
-        file_exist = os.path.isfile(file_name)
-        if not cover_file and file_exist:
-            return np.load(file_name)
-        latencies = np.array([self.simulate_once() for _ in range(n)])
+    def get_latency_n_times(self, n, to_file=False, cover_file=False, seed=None, cache=None):
+        """
+        Sample n latencies, reusing a stored result when one exists for the same parameters, n and seed.
+        Results are looked up in cache (or the default cache when enabled) unless cover_file is set, and written
+        back when to_file is set, to a cache under the default root if none is configured.
+        Unseeded calls bypass the cache altogether, so that every one of them is an independent draw.
+        """
+        if seed is None:
+            if to_file:
+                Log.W('Latency Sampling', 'Unseeded latencies are not cached. Provide a seed to store them.')
+            return self.simulate_batch(n)
+        cache = cache or get_default_cache()
+        if to_file and cache is None:
+            cache = ResultCache()
+        params = {'engine': engine_params(self), 'n': n, 'seed': normalize_param(seed)}
+        key = ResultCache.key(type(self).__name__ + '.get_latency_n_times', params)
+        if cache is not None and not cover_file:
+            latencies = cache.get(key)
+            if latencies is not None:
+                return latencies
+        latencies = self.simulate_batch(n, seed=seed)
         if to_file:
-            if not file_exist or cover_file:
-                np.save(file_name, latencies)
+            cache.put(key, latencies, meta={'name': self.to_identifier_string() + ('_%d' % n), 'params': params})
         return latencies
 
+    def get_latency_n_times_parallel(self, n, seed=None, workers=None):
+        return self.simulate_parallel(n, seed=seed, workers=workers)
+
+    def get_latency_distribution(self, n, seed=None, workers=1, dtype=np.float64):
+        """Empirical LatencyDistribution of n trials; timeouts form the tail at end_time + TIMEOUT_NOTIFIER."""
+        latencies = self.simulate_batch(n, seed=seed) if workers == 1 else \
+            self.simulate_parallel(n, seed=seed, workers=workers)
+        return LatencyDistribution.from_samples(latencies, self.end_time + TIMEOUT_NOTIFIER, dtype)
+
 
 class PureBleSimulator(AbstractSimulator):
     def __init__(self, adv_interval, scan_interval, scan_window, end_time, loss_rate=0, max_advdelay=10):
@@ -86,9 +379,6 @@ class PureBleSimulator(AbstractSimulator):
     def to_identifier_string(self):
         return 'A%d_' % self.adv_interval + super().to_identifier_string()
 
-    def get_latency_n_times(self, n, to_file=False, cover_file=False, file_prefix=LOG_ROOT + 'singleSource/'):
-        return super().get_latency_n_times(n=n, to_file=to_file, cover_file=cover_file, file_prefix=file_prefix)
-
     def simulate_once(self):
         adv_seq = self.gen_adv_seq()
         scan_seq = self.gen_scan_seq()
@@ -115,6 +405,23 @@ class PureBleSimulator(AbstractSimulator):
        # print(scan_seq, adv_seq)
         return self.end_time + TIMEOUT_NOTIFIER
 
+    def simulate_batch(self, n, seed=None):
+        return ble_batch_latency(np.random.default_rng(seed), n, self.adv_interval, self.scan_interval,
+                                 self.scan_window, self.end_time, self.fail_rate, self.max_advdelay)
+
+    def simulate_with_phases(self, rng, n, phase_u, fail_rate, losses):
+        return ble_batch_latency(rng, n, self.adv_interval, self.scan_interval, self.scan_window, self.end_time,
+                                 fail_rate, self.max_advdelay, adv_phase=(phase_u[:, 0] * self.adv_interval),
+                                 scan_phase=(phase_u[:, 1] * self.scan_interval), losses=losses)
+
+
+class EventSkippingBleSimulator(PureBleSimulator):
+    """PureBleSimulator whose batch engine jumps straight to the advertising events that can reach a scan window."""
+    def simulate_batch(self, n, seed=None):
+        return ble_skipping_latency(np.random.default_rng(seed), n, self.adv_interval, self.scan_interval,
+                                    self.scan_window, self.end_time, self.fail_rate, self.max_advdelay)
+
+
 class AlternationBroadcastSampler(AbstractSimulator):
     def __init__(self, abp_config: AlternationBroadcastConfig, scan_interval, scan_window, end_time, loss_rate=0):
         super().__init__(scan_interval, scan_window, end_time, fail_rate=loss_rate, max_advdelay=0)
@@ -145,5 +452,12 @@ class AlternationBroadcastSampler(AbstractSimulator):
             scan_up_ts = scan_down_ts - self.scan_window
         return self.end_time + TIMEOUT_NOTIFIER
 
-    def get_latency_n_times(self, n, to_file=False, cover_file=False, file_prefix=LOG_ROOT + 'alternationBroadcast/'):
-        return super().get_latency_n_times(n=n, to_file=to_file, cover_file=cover_file, file_prefix=file_prefix)
\ No newline at end of file
+    def simulate_batch(self, n, seed=None):
+        return abp_batch_latency(np.random.default_rng(seed), n, self.abp_config.schedule(), self.scan_interval,
+                                 self.scan_window, self.end_time, self.fail_rate)
+
+    def simulate_with_phases(self, rng, n, phase_u, fail_rate, losses):
+        return abp_batch_latency(rng, n, self.abp_config.schedule(), self.scan_interval, self.scan_window,
+                                 self.end_time, fail_rate,
+                                 start_value=(phase_u[:, 0] * (self.abp_config.itv_sum + 1)).astype(np.int64),
+                                 scan_phase=(phase_u[:, 1] * (self.scan_interval + 1)), losses=losses)
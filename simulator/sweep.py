@@ -0,0 +1,161 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from algo.accumulator import VectorizedSummationAccumulator
+from algo.distribution import LatencyDistribution
+from simulator.coverage import AlternationBroadcastConfig
+from simulator.determined import DynamicProjectionLossAdvdelaySimulator
+from utils import Log
+
+SWEEP_AXES = ('adv_interval', 'scan_interval', 'scan_window', 'loss_rate', 'max_advdelay')
+# Values of the axes a grid leaves out.
+DEFAULT_AXIS_VALUES = {'loss_rate': [0], 'max_advdelay': [10]}
+# Grid points per task of the determined engine, which all share one table of advDelay layers.
+DETERMINED_TASK_SIZE = 16
+
+
+def cover_count_histograms(event_ts, scan_interval, scan_window):
+    """
+    For every advertise event, the number of scan phases it covers split by how many earlier events covered them:
+    histograms[n, c] phases of event n were covered c times before. These counts fully determine the discovery
+    probability of every event whatever the loss rate q: (1 - q) / scan_interval * sum_c histograms[n, c] * q ** c.
+    """
+    cover_count = np.zeros(scan_interval, dtype=np.int64)
+    window_offsets = np.arange(1 - scan_window, 1)
+    rows = []
+    for ts in event_ts:
+        covered = (ts % scan_interval + window_offsets) % scan_interval
+        rows.append(np.bincount(cover_count[covered]))
+        cover_count[covered] += 1
+    histograms = np.zeros((len(rows), max((len(row) for row in rows), default=1)), dtype=np.int64)
+    for n, row in enumerate(rows):
+        histograms[n, :len(row)] = row
+    return histograms
+
+
+def coverage_distribution(event_ts, histograms, adv_interval, scan_interval, end_time, fail_rate,
+                          dtype=np.float64):
+    """CLIFABL.simulate_all of a single advertising interval at loss ratio fail_rate, from cover-count histograms."""
+    discovery_prob = (1 - fail_rate) / scan_interval * (histograms @ fail_rate ** np.arange(histograms.shape[1]))
+    starts = np.append(event_ts, end_time)
+    weights = np.append(discovery_prob, 1 - discovery_prob.sum())
+    return LatencyDistribution.from_boxes(starts, adv_interval, weights, end_time, dtype)
+
+
+def _run_task(sweep, task):
+    return sweep.run_task(task)
+
+
+class ParameterSweep:
+    """
+    Evaluate a grid over SWEEP_AXES, planned so that work shared by several points is done once.
+    grid maps every axis to a list of values; loss_rate and max_advdelay default to DEFAULT_AXIS_VALUES.
+    engine selects the analytic engine:
+    - 'coverage': the lossy coverage inference (CLIFABL with a single advertising interval), which ignores advDelay.
+      The cover-count histograms of (adv_interval, scan_interval, scan_window) are computed once and yield every
+      loss rate of the grid in a matrix product. The max_advdelay axis is collapsed: each loss rate is evaluated once
+      and its result repeated for every max_advdelay, and a warning is logged when the grid holds several of them.
+    - 'determined': DynamicProjectionLossAdvdelaySimulator. Points sharing max_advdelay are evaluated together and
+      share one table of advDelay layers.
+    run() streams (point, result) pairs in plan order, result being a CDF of length end_time + 1 or, with
+    as_distribution, a LatencyDistribution of horizon end_time, whatever the engine: the timeouts of the determined
+    engine are lumped with its latencies of end_time into the last bin, like the clipped latencies of the coverage one.
+    """
+    def __init__(self, grid, end_time, engine='coverage', as_distribution=False, dtype=np.float64):
+        if engine not in ('coverage', 'determined'):
+            raise ValueError(f"Unknown sweep engine {engine}.")
+        unknown = set(grid) - set(SWEEP_AXES)
+        if unknown:
+            raise ValueError(f"Unknown sweep axes {sorted(unknown)}.")
+        missing = [axis for axis in SWEEP_AXES if axis not in grid and axis not in DEFAULT_AXIS_VALUES]
+        if missing:
+            raise ValueError(f"Sweep axes {missing} must be provided.")
+        self.grid = {axis: list(grid.get(axis, DEFAULT_AXIS_VALUES.get(axis))) for axis in SWEEP_AXES}
+        if engine == 'coverage' and len(set(self.grid['max_advdelay'])) > 1:
+            Log.W('ParameterSweep', 'The coverage engine ignores advDelay: every max_advdelay of the grid yields '
+                                    'the same result.')
+        self.end_time = end_time
+        self.engine = engine
+        self.as_distribution = as_distribution
+        self.dtype = dtype
+
+    def points(self):
+        """Valid grid points as dicts, skipping scan windows longer than their scan interval."""
+        result = []
+        for values in itertools.product(*(self.grid[axis] for axis in SWEEP_AXES)):
+            point = dict(zip(SWEEP_AXES, values))
+            if point['scan_window'] > point['scan_interval']:
+                continue
+            result.append(point)
+        return result
+
+    def plan(self):
+        """Tasks as (shared key, points) pairs; every task is run by a single worker."""
+        points = self.points()
+        if self.engine == 'coverage':
+            groups = dict()
+            for point in points:
+                key = (point['adv_interval'], point['scan_interval'], point['scan_window'])
+                groups.setdefault(key, []).append(point)
+            return list(groups.items())
+        points.sort(key=lambda p: p['max_advdelay'])
+        tasks = []
+        for max_advdelay, group in itertools.groupby(points, key=lambda p: p['max_advdelay']):
+            group = list(group)
+            for start in range(0, len(group), DETERMINED_TASK_SIZE):
+                tasks.append((max_advdelay, group[start:start + DETERMINED_TASK_SIZE]))
+        return tasks
+
+    def run_task(self, task):
+        key, points = task
+        if self.engine == 'coverage':
+            adv_interval, scan_interval, scan_window = key
+            event_ts = AlternationBroadcastConfig([adv_interval]).schedule().timestamps(0, self.end_time)
+            histograms = cover_count_histograms(event_ts, scan_interval, scan_window)
+            # loss_rate -> result, shared by the points differing only in max_advdelay
+            by_loss_rate = dict()
+            results = []
+            for point in points:
+                if point['loss_rate'] in by_loss_rate:
+                    result = by_loss_rate[point['loss_rate']]
+                    # Distributions are immutable, CDF arrays are not
+                    results.append(result if self.as_distribution else result.copy())
+                    continue
+                distribution = coverage_distribution(event_ts, histograms, adv_interval, scan_interval,
+                                                     self.end_time, point['loss_rate'] / 100, self.dtype)
+                result = distribution if self.as_distribution else self.to_cdf(distribution)
+                by_loss_rate[point['loss_rate']] = result
+                results.append(result)
+            return results
+
+        delay_layers = VectorizedSummationAccumulator(key)
+        results = []
+        for point in points:
+            simulator = DynamicProjectionLossAdvdelaySimulator(point['adv_interval'], point['scan_interval'],
+                                                               point['scan_window'], self.end_time,
+                                                               point['loss_rate'], point['max_advdelay'])
+            simulator.delay_layers = delay_layers
+            distribution = LatencyDistribution.from_dense(simulator.simulate_all(to_cdf=False), self.end_time,
+                                                          self.dtype)
+            results.append(distribution if self.as_distribution else self.to_cdf(distribution))
+        return results
+
+    @staticmethod
+    def to_cdf(distribution):
+        cdf = distribution.to_cdf()
+        cdf[-1] = 1.0
+        return cdf
+
+    def run(self, workers=1):
+        """Yield (point, result) for every grid point, in plan order whatever the number of workers."""
+        tasks = self.plan()
+        Log.D('ParameterSweep', lambda: f'{sum(len(points) for _, points in tasks)} points in {len(tasks)} tasks')
+        if workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield from zip(task[1], self.run_task(task))
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for task, results in zip(tasks, executor.map(_run_task, itertools.repeat(self), tasks)):
+                yield from zip(task[1], results)
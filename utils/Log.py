@@ -12,26 +12,36 @@ global LOG_LEVEL
 LOG_LEVEL = LogLevel.NORMAL
 
 
-def E(tag='', msg=''):
-    sys.stderr.write(f'E[{tag}]:{msg}\n')
+def format_message(msg, args):
+    """
+    Messages are formatted only once they are emitted: msg may be a callable returning the message, or a %-format
+    string applied to args, so that disabled levels cost no formatting.
+    """
+    if callable(msg):
+        msg = msg()
+    return msg % args if args else msg
 
 
-def W(tag='', msg=''):
-    sys.stdout.write(f'W[{tag}]:{msg}\n')
+def E(tag='', msg='', *args):
+    sys.stderr.write(f'E[{tag}]:{format_message(msg, args)}\n')
 
 
-def I(tag='', msg=''):
-    sys.stdout.write(f'I[{tag}]:{msg}\n')
+def W(tag='', msg='', *args):
+    sys.stdout.write(f'W[{tag}]:{format_message(msg, args)}\n')
 
 
-def D(tag='', msg=''):
+def I(tag='', msg='', *args):
+    sys.stdout.write(f'I[{tag}]:{format_message(msg, args)}\n')
+
+
+def D(tag='', msg='', *args):
     if LOG_LEVEL.value >= LogLevel.DEBUG.value:
-        sys.stdout.write(f'D[{tag}]:{msg}\n')
+        sys.stdout.write(f'D[{tag}]:{format_message(msg, args)}\n')
 
 
-def V(tag='', msg=''):
+def V(tag='', msg='', *args):
     if LOG_LEVEL.value >= LogLevel.VERBOSE.value:
-        sys.stdout.write(f'I[{tag}]:{msg}\n')
+        sys.stdout.write(f'I[{tag}]:{format_message(msg, args)}\n')
 
 
 def set_level(level: LogLevel):
@@ -50,4 +60,5 @@ def verbose():
 
 
 def reset():
+    global LOG_LEVEL
     LOG_LEVEL = LogLevel.NORMAL
@@ -0,0 +1,208 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils import Log
+
+# Bump whenever a change alters the numbers an engine produces, so stale entries are never served.
+CODE_VERSION = 2
+CACHE_ROOT_ENV = 'BLENDER_CACHE_ROOT'
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'blender')
+DEFAULT_MAX_BYTES = 1 << 30
+LOCK_TIMEOUT = 30.0
+
+
+def normalize_param(value):
+    """Reduce a parameter value to plain JSON types. Returns None for values that do not identify a result."""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [normalize_param(v) for v in value]
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': normalize_param(value.entropy), 'spawn_key': list(value.spawn_key)}
+    if hasattr(value, 'root_seq'):
+        # AlternationBroadcastConfig: only the root sequence matters, the iteration pointer is transient state.
+        return {'root_seq': [int(v) for v in value.root_seq]}
+    return None
+
+
+def engine_params(engine):
+    """Collect the scalar and sequence attributes that fully describe an engine configuration."""
+    names = [name for cls in reversed(type(engine).__mro__) for name in getattr(cls, '__slots__', ())]
+    if hasattr(engine, '__dict__'):
+        names += list(vars(engine).keys())
+    params = dict()
+    for name in names:
+        value = getattr(engine, name, None)
+        if isinstance(value, (np.ndarray, dict)):
+            continue
+        normalized = normalize_param(value)
+        if normalized is not None:
+            params[name] = normalized
+    return params
+
+
+class ResultCache:
+    """
+    Content-addressed store of numpy results.
+    Entries are keyed by a hash of the engine name, its parameters and CODE_VERSION, listed in a small JSON index
+    and evicted least-recently-used once the total size exceeds max_bytes. Data files are written to a temporary
+    file and renamed into place, and the index is only modified under a lock file, so several processes can share
+    one root.
+    """
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.lock'
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or os.environ.get(CACHE_ROOT_ENV) or DEFAULT_ROOT
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(engine_name, params):
+        identity = json.dumps({'engine': engine_name, 'params': params, 'version': CODE_VERSION}, sort_keys=True)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npy')
+
+    def _acquire(self):
+        lock_path = os.path.join(self.root, self.LOCK_FILE)
+        deadline = time.time() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return lock_path
+            except FileExistsError:
+                if time.time() > deadline:
+                    # The holder most likely died while holding the lock.
+                    Log.W('ResultCache', f'Breaking stale lock {lock_path}.')
+                    os.remove(lock_path)
+                    deadline = time.time() + LOCK_TIMEOUT
+                time.sleep(0.01)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.root, self.INDEX_FILE), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+
+    def _write_index(self, index):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.json.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.root, self.INDEX_FILE))
+
+    def get(self, key):
+        try:
+            result = np.load(self._path(key))
+        except (FileNotFoundError, ValueError, EOFError):
+            return None
+        lock_path = self._acquire()
+        try:
+            index = self._read_index()
+            if key in index:
+                index[key]['last_access'] = time.time()
+                self._write_index(index)
+        finally:
+            os.remove(lock_path)
+        return result
+
+    def put(self, key, result, meta=None):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.npy.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, result)
+        size = os.path.getsize(tmp_path)
+        lock_path = self._acquire()
+        try:
+            os.replace(tmp_path, self._path(key))
+            index = self._read_index()
+            index[key] = {'bytes': size, 'last_access': time.time(), **(meta or dict())}
+            self._evict(index, keep=key)
+            self._write_index(index)
+        finally:
+            os.remove(lock_path)
+
+    def _evict(self, index, keep):
+        total = sum(entry['bytes'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= index.pop(key)['bytes']
+
+    def clear(self):
+        lock_path = self._acquire()
+        try:
+            for key in self._read_index():
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._write_index(dict())
+        finally:
+            os.remove(lock_path)
+
+
+global DEFAULT_CACHE
+DEFAULT_CACHE = ResultCache() if os.environ.get(CACHE_ROOT_ENV) else None
+
+
+def enable(root=None, max_bytes=DEFAULT_MAX_BYTES):
+    global DEFAULT_CACHE
+    DEFAULT_CACHE = ResultCache(root, max_bytes)
+    return DEFAULT_CACHE
+
+
+def disable():
+    global DEFAULT_CACHE
+    DEFAULT_CACHE = None
+
+
+def get_default_cache():
+    return DEFAULT_CACHE
+
+
+def cached(ignore=()):
+    """
+    Memoize an engine method through the default cache. The key covers the engine's parameters and the method's
+    bound arguments, except those named in ignore (e.g. execution-only options).
+    Without an enabled default cache the method runs as usual.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = get_default_cache()
+            if cache is None:
+                return method(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: normalize_param(value) for name, value in bound.arguments.items()
+                         if name != 'self' and name not in ignore}
+            engine_name = f'{type(self).__name__}.{method.__name__}'
+            params = {'engine': engine_params(self), 'arguments': arguments}
+            key = cache.key(engine_name, params)
+            result = cache.get(key)
+            if result is None:
+                result = method(self, *args, **kwargs)
+                cache.put(key, result, meta={'engine': engine_name, 'params': params})
+            return result
+        return wrapper
+    return decorator
@@ -1,13 +1,71 @@
 import numpy as np
-from scipy.interpolate import interp1d
+from scipy import stats
+
+
+def wilson_interval(success_count, n, confidence=0.95):
+    """Wilson score interval of a binomial proportion."""
+    z = stats.norm.ppf(0.5 + confidence / 2)
+    p = success_count / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, float(center - half_width)), min(1.0, float(center + half_width))
+
+
+def clopper_pearson_interval(success_count, n, confidence=0.95):
+    """Exact (Clopper-Pearson) interval of a binomial proportion."""
+    alpha = 1 - confidence
+    low = stats.beta.ppf(alpha / 2, success_count, n - success_count + 1) if success_count > 0 else 0.0
+    high = stats.beta.ppf(1 - alpha / 2, success_count + 1, n - success_count) if success_count < n else 1.0
+    return float(low), float(high)
+
+
+BINOMIAL_INTERVALS = {
+    'wilson': wilson_interval,
+    'clopper-pearson': clopper_pearson_interval,
+}
+
+
+def empirical_cdf(latencies, end_time):
+    """
+    CDF over [0, end_time] of sampled latencies, aligned with the analytic engines: latencies beyond end_time
+    (timeouts) fall into the last bin, so the CDF ends at 1. Histogrammed by bincount in O(n + end_time).
+    """
+    latencies = np.asarray(latencies, dtype=np.int64)
+    counts = np.bincount(np.minimum(latencies, end_time), minlength=end_time + 1)
+    return np.cumsum(counts) / len(latencies)
 
 
 def mse(emulation_latencies, simulation_cdf, end_time, sample_num=10000):
-    # TODO: Calculate mse between the emulation latencies and simulation cdf
-    # latency_range = np.linspace(0, end_time, num=sample_num)
-    # count, bins_count = np.histogram(emulation_latencies, bins=np.arange(0, end_time))
-    # pdf = count / sum(count)
-    # cdf = np.cumsum(pdf)
-    # f = interp1d(np.concatenate(([0], bins_count[1:], [end_time])), np.concatenate((np.array([0]), cdf, np.array([1]))))
-    # cdf_no = f(latency_range)
-    pass
\ No newline at end of file
+    """
+    Mean squared error between the empirical CDF of emulation latencies and simulation_cdf, at sample_num latencies
+    evenly spread over [0, end_time].
+    """
+    latency_range = np.linspace(0, end_time, num=sample_num).astype(np.int64)
+    cdf = empirical_cdf(emulation_latencies, end_time)
+    return float(np.mean((cdf[latency_range] - np.asarray(simulation_cdf)[latency_range]) ** 2))
+
+
+def rmse(emulation_latencies, simulation_cdf, end_time, sample_num=10000):
+    return float(np.sqrt(mse(emulation_latencies, simulation_cdf, end_time, sample_num)))
+
+
+def ks_statistic(cdf_a, cdf_b):
+    """Kolmogorov-Smirnov distance: largest vertical gap between two CDFs over the same latencies."""
+    return float(np.max(np.abs(np.asarray(cdf_a) - np.asarray(cdf_b))))
+
+
+def max_cdf_gap(cdf_a, cdf_b, levels=(0.01, 0.99)):
+    """
+    Largest horizontal gap between two CDFs over the same latencies: the largest latency difference between
+    their quantiles at any probability level either of them reaches within the band levels. The band leaves out the
+    extremes, where the few samples of an empirical CDF make quantiles arbitrarily far apart; None keeps every level.
+    """
+    cdf_a, cdf_b = np.asarray(cdf_a), np.asarray(cdf_b)
+    low, high = levels if levels is not None else (0, 1)
+    levels = np.unique(np.concatenate((cdf_a, cdf_b, [low, high])))
+    levels = levels[(levels > 0) & (levels >= low) & (levels <= high)]
+    # Tolerate the rounding of cumulative sums that should reach a level exactly
+    quantile_a = np.searchsorted(cdf_a, levels - 1e-12, side='left').clip(None, len(cdf_a) - 1)
+    quantile_b = np.searchsorted(cdf_b, levels - 1e-12, side='left').clip(None, len(cdf_b) - 1)
+    return int(np.max(np.abs(quantile_a - quantile_b), initial=0))
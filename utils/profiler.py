@@ -0,0 +1,110 @@
+"""
+Counters and timers for the hot paths of the engines, off by default.
+While disabled, count() returns after one global check and timer() hands back a shared no-op context, so
+instrumented code costs a function call. Once enabled, counters accumulate, timers aggregate their calls and
+durations, and every timed span is kept for export to JSON (to_json) or to the Chrome trace format (to_chrome_trace,
+viewable in chrome://tracing or Perfetto). Only the calling process is profiled: work done in process pools is not.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+global PROFILING
+PROFILING = False
+
+COUNTERS = defaultdict(int)
+# name -> [calls, seconds]
+TIMERS = defaultdict(lambda: [0, 0.0])
+# (name, start, duration) of every timed span, in seconds since the profiler was enabled
+SPANS = []
+global ORIGIN
+ORIGIN = time.perf_counter()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        stat = TIMERS[self.name]
+        stat[0] += 1
+        stat[1] += duration
+        SPANS.append((self.name, self.start - ORIGIN, duration))
+        return False
+
+
+def enable():
+    global PROFILING
+    PROFILING = True
+
+
+def disable():
+    global PROFILING
+    PROFILING = False
+
+
+def enabled():
+    return PROFILING
+
+
+def reset():
+    global ORIGIN
+    COUNTERS.clear()
+    TIMERS.clear()
+    SPANS.clear()
+    ORIGIN = time.perf_counter()
+
+
+def count(name, n=1):
+    if not PROFILING:
+        return
+    COUNTERS[name] += n
+
+
+def timer(name):
+    """Context manager timing its body under name."""
+    if not PROFILING:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def profile():
+    """Counters and per-timer calls and total seconds so far."""
+    return {'counters': dict(COUNTERS),
+            'timers': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in TIMERS.items()}}
+
+
+def to_json(path):
+    with open(path, 'w') as f:
+        json.dump(profile(), f, indent=2)
+
+
+def to_chrome_trace(path):
+    """Timed spans as complete events and final counter values as counter events, in microseconds."""
+    pid, tid = os.getpid(), threading.get_ident()
+    events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': tid}
+              for name, start, duration in SPANS]
+    end = max((start + duration for _, start, duration in SPANS), default=0.0)
+    events += [{'name': name, 'ph': 'C', 'ts': end * 1e6, 'pid': pid, 'args': {name: value}}
+               for name, value in COUNTERS.items()]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
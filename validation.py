@@ -0,0 +1,149 @@
+"""
+Headless batch validation of the analytic engines against the samplers.
+Every configuration runs its analytic engine and its sampler; the sampled latencies are histogrammed into an
+empirical CDF and compared with the analytic CDF by RMSE, KS distance and largest horizontal CDF gap over the
+probability levels of GAP_LEVELS (--gap-levels). Configurations run in parallel and the summary table is written as
+CSV, one row per configuration in input order, after a comment line recording the band.
+A configuration is a dict with scan_interval, scan_window, end_time, loss_rate (%) and either adv_interval
+(with optional max_advdelay; BruteForceLossAdvdelaySimulator vs PureBleSimulator) or root_seq (CLIFABL vs
+AlternationBroadcastSampler).
+
+    python validation.py --configs configs.json --output summary.csv --workers 8
+    python validation.py --random 1000 --seed 1 --output summary.csv
+"""
+import argparse
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulator.coverage import AlternationBroadcastConfig, CLIFABL
+from simulator.determined import BruteForceLossAdvdelaySimulator
+from simulator.sampler import AlternationBroadcastSampler, PureBleSimulator
+from utils import Log
+from utils.eval import empirical_cdf, ks_statistic, max_cdf_gap, rmse
+
+VALIDATION_SEED = 2023
+# Sampled latencies per configuration.
+VALIDATION_TRIALS = 50000
+# Probability band of the horizontal CDF gap, leaving out the sampler's few extreme samples.
+GAP_LEVELS = (0.01, 0.99)
+SUMMARY_FIELDS = ('index', 'adv_interval', 'root_seq', 'scan_interval', 'scan_window', 'end_time', 'loss_rate',
+                  'max_advdelay', 'rmse', 'ks', 'max_cdf_gap', 'analytic_seconds', 'sampler_seconds', 'status')
+
+
+def random_configs(count, seed=VALIDATION_SEED, abp_share=0.5, end_time=50000):
+    """Random configurations over the parameter ranges of playground.py, a share of them ABP."""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(count):
+        scan_interval = int(rng.integers(1000, 5001))
+        config = {'scan_interval': scan_interval, 'scan_window': int(rng.integers(30, scan_interval // 3 * 2 + 1)),
+                  'end_time': end_time, 'loss_rate': int(rng.integers(0, 66))}
+        if rng.random() < abp_share:
+            config['root_seq'] = rng.choice(np.arange(1000, 6000), size=int(rng.integers(1, 11)),
+                                            replace=False).tolist()
+        else:
+            config['adv_interval'] = int(rng.integers(200, scan_interval - 499))
+            config['max_advdelay'] = int(rng.integers(0, 16))
+        configs.append(config)
+    return configs
+
+
+def build_engines(config):
+    """The (analytic engine, sampler) pair of a configuration."""
+    if 'root_seq' in config:
+        abp_config = AlternationBroadcastConfig(list(config['root_seq']))
+        return (CLIFABL(abp_config, config['scan_interval'], config['scan_window'], config['end_time'],
+                        config['loss_rate'] / 100),
+                AlternationBroadcastSampler(abp_config, config['scan_interval'], config['scan_window'],
+                                            config['end_time'], config['loss_rate']))
+    args = (config['adv_interval'], config['scan_interval'], config['scan_window'], config['end_time'],
+            config['loss_rate'], config.get('max_advdelay', 10))
+    return BruteForceLossAdvdelaySimulator(*args), PureBleSimulator(*args)
+
+
+def validate(config, seed, trials=VALIDATION_TRIALS, gap_levels=GAP_LEVELS):
+    """Summary row of one configuration; failures are reported in its status instead of stopping the batch."""
+    row = {field: config.get(field) for field in SUMMARY_FIELDS if field in config}
+    try:
+        blender, sampler = build_engines(config)
+        start = time.perf_counter()
+        analytic_cdf = blender.simulate_all(to_cdf=True)
+        row['analytic_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        latencies = sampler.simulate_batch(trials, seed=seed)
+        row['sampler_seconds'] = time.perf_counter() - start
+    except (NotImplementedError, ValueError) as e:
+        row['status'] = f'{type(e).__name__}: {e}'
+        return row
+    # The last bin holds the timeouts (end_time + 1) of BruteForceLossAdvdelaySimulator, the clipped latencies of
+    # CLIFABL (end_time)
+    horizon = len(analytic_cdf) - 1
+    sampled_cdf = empirical_cdf(latencies, horizon)
+    row['rmse'] = rmse(latencies, analytic_cdf, horizon)
+    row['ks'] = ks_statistic(sampled_cdf, analytic_cdf)
+    row['max_cdf_gap'] = max_cdf_gap(sampled_cdf, analytic_cdf, gap_levels)
+    row['status'] = 'ok'
+    return row
+
+
+def _validate(args):
+    return validate(*args)
+
+
+def run(configs, workers=1, seed=VALIDATION_SEED, trials=VALIDATION_TRIALS, gap_levels=GAP_LEVELS):
+    """Yield the summary rows of configs in input order. Configuration i samples with seed + i."""
+    tasks = [(config, seed + i, trials, gap_levels) for i, config in enumerate(configs)]
+    if workers == 1:
+        rows = map(_validate, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        rows = executor.map(_validate, tasks)
+    try:
+        for i, row in enumerate(rows):
+            row['index'] = i
+            yield row
+    finally:
+        if workers != 1:
+            executor.shutdown()
+
+
+def write_summary(rows, path, gap_levels=GAP_LEVELS):
+    """Write rows as CSV, flushing every row so that a long batch can be followed and survives interruptions."""
+    with open(path, 'w', newline='') as f:
+        f.write(f'# max_cdf_gap over probability levels [{gap_levels[0]}, {gap_levels[1]}]\n')
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            f.flush()
+            Log.D('Validation', '#%d %s ks=%s', row['index'], row['status'], row.get('ks'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate the analytic engines against the samplers.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--configs', help='JSON file holding a list of configurations')
+    source.add_argument('--random', type=int, help='number of random configurations to generate')
+    parser.add_argument('--seed', type=int, default=VALIDATION_SEED, help='seed of the configurations and samplers')
+    parser.add_argument('--trials', type=int, default=VALIDATION_TRIALS, help='sampled latencies per configuration')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--gap-levels', type=float, nargs=2, default=GAP_LEVELS, metavar=('LOW', 'HIGH'),
+                        help='probability band of the horizontal CDF gap')
+    parser.add_argument('--output', default='validation.csv', help='summary CSV')
+    args = parser.parse_args()
+
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    else:
+        configs = random_configs(args.random, args.seed)
+    gap_levels = tuple(args.gap_levels)
+    write_summary(run(configs, args.workers, args.seed, args.trials, gap_levels), args.output, gap_levels)
+
+
+if __name__ == '__main__':
+    main()